@@ -0,0 +1,361 @@
+"""
+Scaling benchmarks for konfigenetes.
+
+Generates synthetic input graphs at several sizes, times each phase of a render, and saves the results as JSON:
+
+    python benchmarks/benchmark.py run --output results.json
+
+Compare against a saved baseline, flagging phases that got slower or scale worse:
+
+    python benchmarks/benchmark.py compare baseline.json results.json
+
+Measure the peak memory allocated while finding vars in one large synthetic input graph:
+
+    python benchmarks/benchmark.py memory --size 5000
+"""
+import argparse
+import gc
+import json
+import math
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from konfigenetes.konfigenetes import (YAML_BACKEND, apply_patches, dump_yaml_documents,  # noqa: E402
+                                       find_string_var_lists_recursive, load_resource_files, resolve_input_files)
+
+DEFAULT_SIZES = [250, 500, 1000, 2000]
+PHASES = ['resolve_inputs', 'load', 'patch', 'find_vars', 'substitute', 'dump']
+VAR_COUNT = 20
+LIST_LENGTH = 50
+RESOURCES_PER_FILE = 10
+
+parser = argparse.ArgumentParser(description='Konfigenetes scaling benchmarks.')
+subparsers = parser.add_subparsers(dest='command')
+
+run_parser = subparsers.add_parser('run', help='Time each phase of a render at several sizes.')
+run_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Numbers of resources to generate.')
+run_parser.add_argument('--repeat', type=int, default=3,
+                        help='Times to run each size. The fastest run is kept.')
+run_parser.add_argument('--output', help='Write results to this JSON file.')
+
+compare_parser = subparsers.add_parser('compare', help='Compare results against a baseline.')
+compare_parser.add_argument('baseline', help='Baseline results JSON file.')
+compare_parser.add_argument('current', help='Current results JSON file.')
+compare_parser.add_argument('--max-slowdown', type=float, default=1.5,
+                            help='Flag phases more than this many times slower than the baseline.')
+compare_parser.add_argument('--max-exponent-increase', type=float, default=0.25,
+                            help='Flag phases whose scaling exponent grew by more than this.')
+
+memory_parser = subparsers.add_parser('memory', help='Measure peak memory allocated while finding vars.')
+memory_parser.add_argument('--size', type=int, default=5000,
+                           help='Number of resources to generate.')
+
+
+def main():
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run_benchmarks(args.sizes, repeat=args.repeat)
+        print_results(results)
+        if args.output is not None:
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+    elif args.command == 'compare':
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        with open(args.current) as current_file:
+            current = json.load(current_file)
+        regressions = compare_results(baseline, current, max_slowdown=args.max_slowdown,
+                                      max_exponent_increase=args.max_exponent_increase)
+        for regression in regressions:
+            print(regression)
+        sys.exit(1 if regressions else 0)
+    elif args.command == 'memory':
+        with tempfile.TemporaryDirectory() as output_dir:
+            root_input_file_path = generate_input_graph(output_dir, **size_parameters(args.size))
+            memory = measure_find_vars_memory(root_input_file_path)
+        print('{} resources, {} strings, {} with vars'.format(
+            memory['resources'], memory['strings'], memory['var_strings']))
+        print('find_vars peak allocated: {:.2f} MiB'.format(memory['peak'] / 1024 / 1024))
+        print('find_vars still allocated: {:.2f} MiB'.format(memory['retained'] / 1024 / 1024))
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+
+def size_parameters(size):
+    """Scale the generated input graph with its size, keeping the amount of data per resource fixed."""
+    return {
+        'resource_count': size,
+        'input_depth': max(1, size // 100),
+        'list_length': LIST_LENGTH,
+        'var_count': VAR_COUNT,
+    }
+
+
+def generate_input_graph(output_dir, resource_count, input_depth, list_length, var_count):
+    """
+    Write a deterministic synthetic input graph to output_dir and return the path of its root input file.
+    The graph is a chain of input_depth input files. Resources are Deployments with list_length env vars
+    and volumes, and ConfigMaps, with vars in images, labels and data. Every other Deployment is patched.
+    """
+    output_dir = Path(output_dir)
+    for subdir in ['inputs', 'resources', 'patches']:
+        (output_dir / subdir).mkdir(parents=True, exist_ok=True)
+
+    resource_file_names = []
+    patch_file_names = []
+    for file_index in range(0, resource_count, RESOURCES_PER_FILE):
+        resources = []
+        patches = []
+        for resource_index in range(file_index, min(file_index + RESOURCES_PER_FILE, resource_count)):
+            resources.append(generate_resource(resource_index, list_length, var_count))
+            if resource_index % 4 == 0:
+                patches.append(generate_patch(resource_index, list_length, var_count))
+
+        resource_file_name = 'resources_{}.yml'.format(file_index // RESOURCES_PER_FILE)
+        with open(str(output_dir / 'resources' / resource_file_name), 'w') as resource_file:
+            resource_file.write(dump_yaml_documents(resources))
+        resource_file_names.append(resource_file_name)
+
+        if patches:
+            patch_file_name = 'patches_{}.yml'.format(file_index // RESOURCES_PER_FILE)
+            with open(str(output_dir / 'patches' / patch_file_name), 'w') as patch_file:
+                patch_file.write(dump_yaml_documents(patches))
+            patch_file_names.append(patch_file_name)
+
+    # Spread the resource and patch files across the chain of input files.
+    for depth in range(input_depth):
+        input_data = {
+            'resources': ['../resources/{}'.format(file_name)
+                          for file_name in resource_file_names[depth::input_depth]],
+            'patches': ['../patches/{}'.format(file_name)
+                        for file_name in patch_file_names[depth::input_depth]],
+        }
+        if depth + 1 < input_depth:
+            input_data['inputs'] = ['input_{}.yml'.format(depth + 1)]
+        else:
+            input_data['vars'] = ['VAR_{}=value-{}'.format(i, i) for i in range(var_count)]
+        with open(str(output_dir / 'inputs' / 'input_{}.yml'.format(depth)), 'w') as input_file:
+            input_file.write(dump_yaml_documents([input_data]))
+
+    return str(output_dir / 'inputs' / 'input_0.yml')
+
+
+def generate_resource(resource_index, list_length, var_count):
+    name = 'service-{}'.format(resource_index // 2)
+    if resource_index % 2 == 1:
+        return {
+            'kind': 'ConfigMap',
+            'apiVersion': 'v1',
+            'metadata': {'name': name},
+            'data': dict(('KEY_{}'.format(i), 'value {} of {{{{ VAR_{} }}}}'.format(i, i % var_count)
+                          if i % 3 == 0 else 'static value {}'.format(i) * 4)
+                         for i in range(list_length)),
+        }
+
+    return {
+        'kind': 'Deployment',
+        'apiVersion': 'apps/v1',
+        'metadata': {
+            'name': name,
+            'labels': {'app': name, 'version': '{{{{ VAR_{} }}}}'.format(resource_index % var_count)},
+        },
+        'spec': {
+            'replicas': 1,
+            'template': {
+                'spec': {
+                    'containers': [{
+                        'name': name,
+                        'image': 'registry/{}:{{{{ VAR_{} }}}}'.format(name, resource_index % var_count),
+                        'env': [{'name': 'ENV_{}'.format(i), 'value': 'VAL_{}'.format(i)}
+                                for i in range(list_length)],
+                        'volumeMounts': [{'name': 'volume-{}'.format(i), 'mountPath': '/mnt/{}'.format(i)}
+                                         for i in range(list_length)],
+                    }],
+                    'volumes': [{'name': 'volume-{}'.format(i), 'emptyDir': {}}
+                                for i in range(list_length)],
+                },
+            },
+        },
+    }
+
+
+def generate_patch(resource_index, list_length, var_count):
+    name = 'service-{}'.format(resource_index // 2)
+    return {
+        'kind': 'Deployment',
+        'apiVersion': 'apps/v1',
+        'metadata': {'name': name},
+        'spec': {
+            'template': {
+                'spec': {
+                    'containers': [{
+                        'name': name,
+                        # Half the env vars override existing ones, half are new.
+                        'env': [{'name': 'ENV_{}'.format(i), 'value': '{{{{ VAR_{} }}}}'.format(i % var_count)}
+                                for i in range(list_length // 2, list_length + list_length // 2)],
+                    }],
+                },
+            },
+        },
+    }
+
+
+def time_render(root_input_file_path):
+    """Run each phase of a render and return how long each took, in seconds."""
+    phase_times = {}
+
+    start_time = time.perf_counter()
+    input_data = resolve_input_files([root_input_file_path])
+    phase_times['resolve_inputs'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    resource_file_paths = input_data['resource_file_paths']
+    document_lists = load_resource_files(resource_file_paths + input_data['patch_file_paths'])
+    resources = [resource for resource_list in document_lists[:len(resource_file_paths)]
+                 for resource, _ in resource_list]
+    patches = [patch for patch_list in document_lists[len(resource_file_paths):]
+               for patch, _ in patch_list]
+    phase_times['load'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    apply_patches(resources, patches)
+    phase_times['patch'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    string_var_lists = []
+    for resource in resources:
+        find_string_var_lists_recursive(resource, string_var_lists=string_var_lists)
+    phase_times['find_vars'] = time.perf_counter() - start_time
+
+    var_values = dict(('VAR_{}'.format(i), 'value-{}'.format(i)) for i in range(VAR_COUNT))
+    start_time = time.perf_counter()
+    for string_var_list in string_var_lists:
+        string_var_list.save(var_values)
+    phase_times['substitute'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    dump_yaml_documents(resources)
+    phase_times['dump'] = time.perf_counter() - start_time
+
+    return phase_times
+
+
+def measure_find_vars_memory(root_input_file_path):
+    """Load and patch a render, then measure the memory allocated while finding vars in it, in bytes."""
+    input_data = resolve_input_files([root_input_file_path])
+    resource_file_paths = input_data['resource_file_paths']
+    document_lists = load_resource_files(resource_file_paths + input_data['patch_file_paths'])
+    resources = [resource for resource_list in document_lists[:len(resource_file_paths)]
+                 for resource, _ in resource_list]
+    patches = [patch for patch_list in document_lists[len(resource_file_paths):]
+               for patch, _ in patch_list]
+    apply_patches(resources, patches)
+
+    gc.collect()
+    tracemalloc.start()
+    string_var_lists = []
+    for resource in resources:
+        find_string_var_lists_recursive(resource, string_var_lists=string_var_lists)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'resources': len(resources),
+        'strings': count_strings(resources),
+        'var_strings': len(string_var_lists),
+        'peak': peak,
+        'retained': retained,
+    }
+
+
+def count_strings(value):
+    if type(value) == dict:
+        return sum(count_strings(item) for item in value.values())
+    if type(value) == list:
+        return sum(count_strings(item) for item in value)
+    return 1 if type(value) == str else 0
+
+
+def run_benchmarks(sizes, repeat=3):
+    phase_results = dict((phase, {'sizes': [], 'times': []}) for phase in PHASES)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as output_dir:
+            root_input_file_path = generate_input_graph(output_dir, **size_parameters(size))
+            best_times = {}
+            for _ in range(repeat):
+                for phase, phase_time in time_render(root_input_file_path).items():
+                    best_times[phase] = min(phase_time, best_times.get(phase, phase_time))
+
+        for phase in PHASES:
+            phase_results[phase]['sizes'].append(size)
+            phase_results[phase]['times'].append(best_times[phase])
+
+    for phase_result in phase_results.values():
+        phase_result['exponent'] = scaling_exponent(phase_result['sizes'], phase_result['times'])
+
+    return {
+        'python': sys.version.split()[0],
+        'yaml_backend': YAML_BACKEND,
+        'phases': phase_results,
+    }
+
+
+def scaling_exponent(sizes, times):
+    """Fit time = c * size ^ exponent by least squares on a log-log scale."""
+    points = [(math.log(size), math.log(phase_time)) for size, phase_time in zip(sizes, times) if phase_time > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def print_results(results):
+    sizes = results['phases'][PHASES[0]]['sizes']
+    print('{:<16}'.format('phase') + ''.join('{:>12}'.format(size) for size in sizes) + '{:>10}'.format('exponent'))
+    for phase in PHASES:
+        phase_result = results['phases'][phase]
+        exponent = phase_result['exponent']
+        print('{:<16}'.format(phase) +
+              ''.join('{:>10.1f}ms'.format(phase_time * 1000) for phase_time in phase_result['times']) +
+              '{:>10}'.format('-' if exponent is None else '{:.2f}'.format(exponent)))
+
+
+def compare_results(baseline, current, max_slowdown=1.5, max_exponent_increase=0.25):
+    """Return a description of every phase that got slower or scales worse than the baseline."""
+    regressions = []
+    for phase, current_result in sorted(current['phases'].items()):
+        baseline_result = baseline['phases'].get(phase)
+        if baseline_result is None:
+            continue
+
+        baseline_times = dict(zip(baseline_result['sizes'], baseline_result['times']))
+        for size, current_time in zip(current_result['sizes'], current_result['times']):
+            baseline_time = baseline_times.get(size)
+            if baseline_time and current_time / baseline_time > max_slowdown:
+                regressions.append('{} at size {}: {:.1f}ms -> {:.1f}ms ({:.2f}x slower)'.format(
+                    phase, size, baseline_time * 1000, current_time * 1000, current_time / baseline_time))
+
+        baseline_exponent = baseline_result.get('exponent')
+        current_exponent = current_result.get('exponent')
+        if (baseline_exponent is not None and current_exponent is not None and
+                current_exponent - baseline_exponent > max_exponent_increase):
+            regressions.append('{} scaling exponent: {:.2f} -> {:.2f}'.format(
+                phase, baseline_exponent, current_exponent))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,26 @@
-from konfigenetes.konfigenetes import konfigenetes
+import sys
+import types
+
+
+class Package(types.ModuleType):
+    """
+    Imports the library the first time konfigenetes.konfigenetes() is used, rather than with the package,
+    so the command line can start without importing PyYAML until it needs to.
+    """
+
+    def __getattr__(self, name):
+        if name != 'konfigenetes':
+            raise AttributeError('module {!r} has no attribute {!r}'.format(self.__name__, name))
+        from konfigenetes.konfigenetes import konfigenetes
+        super().__setattr__('konfigenetes', konfigenetes)
+        return konfigenetes
+
+    def __setattr__(self, name, value):
+        # Importing the konfigenetes submodule sets it as an attribute of the package,
+        # which would hide the konfigenetes() function of the same name.
+        if name == 'konfigenetes' and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = Package
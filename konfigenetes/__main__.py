@@ -0,0 +1,3 @@
+from konfigenetes.cli import main
+
+main()
@@ -0,0 +1,60 @@
+import asyncio
+
+from konfigenetes.konfigenetes import (is_json_file, parse_json_resource_documents, parse_resource_documents,
+                                       parse_var_values, patch_resources, resolve_input_files, substitute_resources)
+
+
+async def konfigenetes_async(input_file_paths=None, resource_file_paths=None, patch_file_paths=None,
+                             var_values=None, executor=None, semaphore=None):
+    """
+    Render like konfigenetes() without blocking the event loop.
+    Files are read concurrently in the loop's default executor. Parsing, patching and substituting vars
+    run in executor, which may be a ThreadPoolExecutor or a ProcessPoolExecutor, and defaults to the
+    loop's default executor.
+    Pass an asyncio.Semaphore shared by many renders to limit how many run at once.
+    Cancelling a render stops waiting for it; work already handed to an executor finishes and is discarded.
+    """
+    if semaphore is None:
+        return await render_async(input_file_paths, resource_file_paths, patch_file_paths, var_values, executor)
+    async with semaphore:
+        return await render_async(input_file_paths, resource_file_paths, patch_file_paths, var_values, executor)
+
+
+async def render_async(input_file_paths, resource_file_paths, patch_file_paths, var_values, executor):
+    loop = asyncio.get_running_loop()
+
+    # Input files are small, so they are read and parsed together.
+    input_data = await loop.run_in_executor(None, resolve_input_files, input_file_paths or [])
+
+    # Config passed into the function should take precedence (be applied after)
+    # the config taken from input files.
+    resource_file_paths = input_data['resource_file_paths'] + (resource_file_paths or [])
+    patch_file_paths = input_data['patch_file_paths'] + (patch_file_paths or [])
+    # New passed in vars must override the vars in the files.
+    var_values = dict(parse_var_values(input_data['var_values_raw']), **(var_values or {}))
+
+    contents = await asyncio.gather(*[loop.run_in_executor(None, read_file, file_path)
+                                      for file_path in resource_file_paths + patch_file_paths])
+    resource_files = list(zip(resource_file_paths, contents[:len(resource_file_paths)]))
+    patch_files = list(zip(patch_file_paths, contents[len(resource_file_paths):]))
+
+    return await loop.run_in_executor(executor, render_files, resource_files, patch_files, var_values)
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as read_file:
+        return read_file.read()
+
+
+def render_files(resource_files, patch_files, var_values):
+    """Render resource and patch files that were already read, as (path, content) pairs."""
+    resources = [resource for file_path, content in resource_files for resource in parse_file(file_path, content)]
+    patches = [patch for file_path, content in patch_files for patch in parse_file(file_path, content)]
+    resources, resources_need_vars = patch_resources(resources, patches)
+    return list(substitute_resources(resources, resources_need_vars, var_values))
+
+
+def parse_file(file_path, content):
+    if is_json_file(file_path):
+        return parse_json_resource_documents(content)
+    return parse_resource_documents(content)
@@ -0,0 +1,120 @@
+import multiprocessing
+import sys
+from pathlib import Path
+
+from konfigenetes.konfigenetes import (dump_yaml_documents, konfigenetes, load_resource_files, load_yaml_document,
+                                       parse_var_values, resolve_input_files)
+from konfigenetes.parse_cache import MemoryCache
+
+# Parsed files shared by every job run in a worker process.
+worker_cache = None
+
+
+def run_batch(manifest_path, processes=None):
+    """Render every job in a batch manifest, report each result on stderr, and return an exit code."""
+    try:
+        jobs = read_manifest(manifest_path)
+    except ValueError as e:
+        print('Fatal Error:\n{}'.format(e), file=sys.stderr)
+        return 1
+
+    exit_code = 0
+    for result in render_many(jobs, processes=processes):
+        if result['error'] is None:
+            print('Rendered {}'.format(result['output_path']), file=sys.stderr)
+        else:
+            print('Failed {}:\n{}'.format(result['output_path'], result['error']), file=sys.stderr)
+            exit_code = 1
+    return exit_code
+
+
+def read_manifest(manifest_path):
+    """
+    Read a batch manifest into a list of jobs for render_many.
+    Each entry of "jobs" takes the same inputs, resources, patches and vars as an input file,
+    plus the output file to render to. Paths are relative to the manifest.
+    """
+    manifest_data = load_yaml_document(manifest_path)
+    if manifest_data is None or type(manifest_data.get('jobs', None)) != list:
+        raise ValueError('"jobs" in batch manifest {} must be a list.'.format(manifest_path))
+
+    manifest_dir = Path(manifest_path).parent
+    jobs = []
+    for job_data in manifest_data['jobs']:
+        if 'output' not in job_data:
+            raise ValueError('"output" must be set for every job in batch manifest {}.'.format(manifest_path))
+
+        job = {'output_path': str(manifest_dir / job_data['output'])}
+        for manifest_key, job_key in [('inputs', 'input_file_paths'),
+                                      ('resources', 'resource_file_paths'),
+                                      ('patches', 'patch_file_paths')]:
+            if manifest_key in job_data:
+                if type(job_data[manifest_key]) != list:
+                    raise ValueError('"{}" in batch manifest {} must be a list.'.format(manifest_key, manifest_path))
+                job[job_key] = [str(manifest_dir / file_path) for file_path in job_data[manifest_key]]
+        if 'vars' in job_data:
+            if type(job_data['vars']) != list:
+                raise ValueError('"vars" in batch manifest {} must be a list.'.format(manifest_path))
+            job['var_values'] = parse_var_values(job_data['vars'])
+        jobs.append(job)
+
+    return jobs
+
+
+def render_many(jobs, processes=None):
+    """
+    Render many jobs in a process pool.
+    Each job is a dict of konfigenetes() arguments (input_file_paths, resource_file_paths,
+    patch_file_paths, var_values) and an optional output_path to write the rendered YAML to.
+    Every file is parsed once, up front, and the parsed files are shared with the workers.
+    Returns a result dict per job, in order. A job that fails gets an error instead of stopping the others.
+    """
+    cache = MemoryCache()
+    for job in jobs:
+        try:
+            input_data = resolve_input_files(job.get('input_file_paths', []), cache=cache)
+            load_resource_files(input_data['resource_file_paths'] + job.get('resource_file_paths', []) +
+                                input_data['patch_file_paths'] + job.get('patch_file_paths', []),
+                                cache=cache)
+        except Exception:
+            # The job reports the error when it is rendered.
+            continue
+
+    if processes == 1 or len(jobs) <= 1:
+        return [render_job(job, cache=cache) for job in jobs]
+
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(cache,)) as pool:
+        return pool.map(render_job, jobs)
+
+
+def init_worker(cache):
+    global worker_cache
+    worker_cache = cache
+
+
+def render_job(job, cache=None):
+    if cache is None:
+        cache = worker_cache
+
+    result = {
+        'output_path': job.get('output_path', None),
+        'output': None,
+        'error': None,
+    }
+    try:
+        konfigured_resources = konfigenetes(
+            job.get('input_file_paths', None),
+            job.get('resource_file_paths', None),
+            job.get('patch_file_paths', None),
+            job.get('var_values', None),
+            cache=cache)
+        output = dump_yaml_documents(konfigured_resources)
+        if result['output_path'] is None:
+            result['output'] = output
+        else:
+            with open(result['output_path'], 'w') as output_file:
+                # Match what main() prints.
+                output_file.write(output + '\n')
+    except Exception as e:
+        result['error'] = str(e)
+    return result
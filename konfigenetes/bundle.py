@@ -0,0 +1,109 @@
+import argparse
+import hashlib
+import marshal
+import struct
+import sys
+
+from konfigenetes.konfigenetes import OUTPUT_FORMATS, dump_output, parse_var_values, write_file_atomically
+from konfigenetes.template import Template, compile_template
+from konfigenetes.version import VERSION
+
+BUNDLE_MAGIC = b'KFB\x00'
+# Bump when the layout of bundles changes.
+BUNDLE_FORMAT_VERSION = 2
+# marshal format 4 is read by every Python 3 this runs on, so a bundle can move between Python versions.
+MARSHAL_VERSION = 4
+# Magic, format version, and the sha256 of the payload that follows.
+BUNDLE_HEADER = struct.Struct('>4sH32s')
+
+
+def write_bundle(template, bundle_path):
+    """
+    Write a template to a bundle file: a header with a format version and checksum,
+    followed by the resources, default vars and var sites.
+    They are plain data, so they are serialized with marshal, and reading a bundle never runs code from it.
+    """
+    try:
+        payload = marshal.dumps({
+            'konfigenetes_version': VERSION,
+            'resources': template.resources,
+            'var_values': template.var_values,
+            'var_sites': template.var_sites,
+        }, MARSHAL_VERSION)
+    except ValueError:
+        raise ValueError('Only strings, numbers, booleans, nulls, lists and maps can be compiled into a bundle. '
+                         'Quote dates and timestamps in resources to compile them.')
+    header = BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION, hashlib.sha256(payload).digest())
+    write_file_atomically(bundle_path, header + payload)
+
+
+def read_bundle(bundle_path):
+    """Read a bundle file back into a Template."""
+    with open(bundle_path, 'rb') as bundle_file:
+        bundle_bytes = bundle_file.read()
+
+    if len(bundle_bytes) < BUNDLE_HEADER.size:
+        raise ValueError('{} is not a konfigenetes bundle.'.format(bundle_path))
+    magic, format_version, checksum = BUNDLE_HEADER.unpack_from(bundle_bytes)
+    if magic != BUNDLE_MAGIC:
+        raise ValueError('{} is not a konfigenetes bundle.'.format(bundle_path))
+    if format_version != BUNDLE_FORMAT_VERSION:
+        raise ValueError('Bundle {} has format version {}, but this konfigenetes reads version {}. '
+                         'Compile it again.'.format(bundle_path, format_version, BUNDLE_FORMAT_VERSION))
+    payload = bundle_bytes[BUNDLE_HEADER.size:]
+    if hashlib.sha256(payload).digest() != checksum:
+        raise ValueError('Bundle {} is corrupt: its checksum does not match.'.format(bundle_path))
+
+    try:
+        bundle_data = marshal.loads(payload)
+        return Template(bundle_data['resources'], bundle_data['var_values'], var_sites=bundle_data['var_sites'])
+    except (ValueError, EOFError, TypeError, KeyError):
+        raise ValueError('Bundle {} is corrupt.'.format(bundle_path))
+
+
+def compile_main(argv):
+    compile_parser = argparse.ArgumentParser(
+        prog='konfigenetes compile',
+        description='Load and patch resources once, into a bundle that "konfigenetes render" fills in vars for.')
+    compile_parser.add_argument('-f', '--input-file', dest='input_file_paths', action='append')
+    compile_parser.add_argument('-r', '--add-resource', dest='resource_file_paths', action='append')
+    compile_parser.add_argument('-p', '--add-patch', dest='patch_file_paths', action='append')
+    compile_parser.add_argument('-o', '--output-file', dest='bundle_path', required=True,
+                                help='Write the bundle to this file.')
+    args = compile_parser.parse_args(argv)
+
+    try:
+        template = compile_template(args.input_file_paths, args.resource_file_paths, args.patch_file_paths)
+        write_bundle(template, args.bundle_path)
+    except ValueError as e:
+        print('Fatal Error:\n{}'.format(e))
+        return 1
+    return 0
+
+
+def render_main(argv):
+    render_parser = argparse.ArgumentParser(
+        prog='konfigenetes render',
+        description='Render a bundle written by "konfigenetes compile" with a set of vars.')
+    render_parser.add_argument('bundle_path')
+    render_parser.add_argument('-s', '--set-var', dest='var_values', action='append')
+    render_parser.add_argument('-o', '--output-file', dest='output_file_path',
+                               help='Write the rendered resources to this file instead of stdout.')
+    render_parser.add_argument('--output', dest='output_format', choices=OUTPUT_FORMATS, default='yaml',
+                               help='Output YAML documents, a JSON List, or one JSON object per line. '
+                                    'Defaults to yaml.')
+    args = render_parser.parse_args(argv)
+
+    try:
+        template = read_bundle(args.bundle_path)
+        konfigured_resources = template.render(parse_var_values(args.var_values or []), in_place=True)
+    except (ValueError, OSError) as e:
+        print('Fatal Error:\n{}'.format(e))
+        return 1
+
+    if args.output_file_path is None:
+        dump_output(konfigured_resources, output_format=args.output_format, stream=sys.stdout)
+    else:
+        with open(args.output_file_path, 'w') as output_file:
+            dump_output(konfigured_resources, output_format=args.output_format, stream=output_file)
+    return 0
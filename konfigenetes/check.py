@@ -0,0 +1,101 @@
+import multiprocessing
+import sys
+
+import yaml
+
+from konfigenetes.konfigenetes import check_missing_vars, find_string_var_lists_recursive, load_patched_resources
+from konfigenetes.parse_cache import MemoryCache
+from konfigenetes.profiling import phase
+
+# Parsed files shared by every check run in a worker process.
+worker_cache = None
+
+
+def run_checks(input_file_paths, resource_file_paths=None, patch_file_paths=None, var_values=None,
+               processes=None):
+    """Check each input file, print a result line per input and return an exit code."""
+    if input_file_paths:
+        jobs = [{'input_file_paths': [input_file_path]} for input_file_path in input_file_paths]
+    else:
+        jobs = [{'input_file_paths': []}]
+    for job in jobs:
+        job['resource_file_paths'] = resource_file_paths or []
+        job['patch_file_paths'] = patch_file_paths or []
+        job['var_values'] = var_values or {}
+
+    exit_code = 0
+    for job, errors in zip(jobs, check_many(jobs, processes=processes)):
+        input_name = job['input_file_paths'][0] if job['input_file_paths'] else '(no input file)'
+        if not errors:
+            print('ok {}'.format(input_name))
+            continue
+        exit_code = 1
+        print('failed {}:'.format(input_name))
+        for error in errors:
+            print('  ' + error.rstrip('\n').replace('\n', '\n  '))
+    sys.stdout.flush()
+    return exit_code
+
+
+def check_many(jobs, processes=None):
+    """
+    Check many jobs in a process pool, returning the list of errors of each job, in order.
+    Each job is a dict of konfigenetes() arguments.
+    """
+    if processes == 1 or len(jobs) <= 1:
+        cache = MemoryCache()
+        return [check(cache=cache, **job) for job in jobs]
+
+    with multiprocessing.Pool(processes, initializer=init_worker) as pool:
+        return pool.map(check_job, jobs)
+
+
+def init_worker():
+    global worker_cache
+    worker_cache = MemoryCache()
+
+
+def check_job(job):
+    return check(cache=worker_cache, **job)
+
+
+def check(input_file_paths=None, resource_file_paths=None, patch_file_paths=None, var_values=None, cache=None):
+    """
+    Check arguments to konfigenetes() without substituting vars or dumping anything.
+    Returns a list of errors: the input graph failing to load, patches that matched no resource,
+    malformed var strings and missing vars.
+    """
+    patch_targets = []
+    try:
+        resources, input_var_values, resources_need_vars = load_patched_resources(
+            input_file_paths, resource_file_paths, patch_file_paths, cache=cache, patch_targets=patch_targets)
+    except (ValueError, OSError, yaml.YAMLError) as e:
+        return [str(e)]
+    var_values = dict(input_var_values, **(var_values or {}))
+
+    errors = []
+    for patch, targets in patch_targets:
+        if not targets:
+            errors.append('Patch matched no resources: {}/{}'.format(
+                patch.get('kind', None), patch.get('metadata', {}).get('name', None)))
+
+    with phase('find_vars'):
+        var_names = set()
+        for resource, needs_vars in zip(resources, resources_need_vars):
+            # Resources without vars don't need to be searched.
+            if not needs_vars:
+                continue
+            string_errors = []
+            for string_var_list in find_string_var_lists_recursive(resource, errors=string_errors):
+                var_names.update(string_var_list.needed_vars)
+            errors += ['{} in {}/{}'.format(e, resource.get('kind', None),
+                                            resource.get('metadata', {}).get('name', None))
+                       for e in string_errors]
+
+        try:
+            check_missing_vars(sorted(var_names), var_values)
+        except ValueError as e:
+            # One error per missing var.
+            errors += [line.strip() for line in str(e).splitlines() if line.strip()]
+
+    return errors
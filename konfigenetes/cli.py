@@ -0,0 +1,276 @@
+import os
+import sys
+
+# Keep imports light: the library and PyYAML are imported by the code paths that need them,
+# after main() has had the chance to forward to a render daemon.
+
+
+def make_parser():
+    import argparse
+
+    from konfigenetes.konfigenetes import OUTPUT_FORMATS, OUTPUT_LAYOUTS, YAML_BACKEND
+    from konfigenetes.version import VERSION
+
+    parser = argparse.ArgumentParser(description='Konfigenetes configures Kubernetes resources dynamically.')
+    parser.add_argument('--version', action='version',
+                        version='konfigenetes {} (yaml backend: {})'.format(VERSION, YAML_BACKEND))
+    parser.add_argument('-f', '--input-file', dest='input_file_paths', action='append')
+    parser.add_argument('-r', '--add-resource', dest='resource_file_paths', action='append')
+    parser.add_argument('-p', '--add-patch', dest='patch_file_paths', action='append')
+    parser.add_argument('-s', '--set-var', dest='var_values', action='append')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        help='Cache parsed files in this directory between runs.')
+    parser.add_argument('--cache-max-size', dest='cache_max_size', type=int,
+                        help='Evict least recently used cache entries past this many bytes. Defaults to 256 MiB.')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Read and parse files in this many threads. '
+                             'With --batch, --check or --output-dir, work in this many processes '
+                             '(defaults to one per CPU).')
+    parser.add_argument('-o', '--output-file', dest='output_file_path',
+                        help='Write the rendered resources to this file instead of stdout.')
+    parser.add_argument('--output-dir', dest='output_dir',
+                        help='Write resources to files in this directory instead of one stream, '
+                             'leaving files whose content is unchanged alone.')
+    parser.add_argument('--output-layout', dest='output_layout', choices=OUTPUT_LAYOUTS, default='resource',
+                        help='With --output-dir, write a file per resource at NAMESPACE/KIND/NAME, '
+                             'or a file per kind and namespace at NAMESPACE/KIND. Defaults to resource.')
+    parser.add_argument('--output', dest='output_format', choices=OUTPUT_FORMATS, default='yaml',
+                        help='Output YAML documents, a JSON List, or one JSON object per line. Defaults to yaml.')
+    parser.add_argument('--prune', dest='prune', action='store_true',
+                        help='With --output-dir, remove files the previous run wrote for resources that are no longer '
+                             'rendered. Only files listed in the output directory\'s .konfigenetes-shards manifest '
+                             'are removed.')
+    parser.add_argument('--raw-passthrough', dest='raw_passthrough', action='store_true',
+                        help='Copy resource documents that no patch targets and that have no vars in them to the '
+                             'output as written, instead of parsing and re-dumping them. Only applies to YAML output, '
+                             'without --since, --output-dir or --render-cache-dir.')
+    parser.add_argument('--watch', dest='watch', action='store_true',
+                        help='Re-render whenever a file in the input graph changes.')
+    parser.add_argument('--watch-interval', dest='watch_interval', type=float, default=0.5,
+                        help='Seconds between checks for changed files.')
+    parser.add_argument('--profile', dest='profile', choices=['text', 'json'], nargs='?', const='text',
+                        help='Report time spent in each phase, file and patch on stderr.')
+    parser.add_argument('--profile-memory', dest='profile_memory', action='store_true',
+                        help='Also report peak memory of each phase with --profile. Slows rendering down.')
+    parser.add_argument('--print-graph', dest='print_graph', action='store_true',
+                        help='Print the graph of input files and what they list, then exit.')
+    parser.add_argument('--socket', dest='socket_path',
+                        help='Render in the daemon started by "konfigenetes serve" on this socket, if it is running. '
+                             'Defaults to $KONFIGENETES_SOCKET.')
+    parser.add_argument('--check', dest='check', action='store_true',
+                        help='Check that each input file resolves, every var is set, every var string is well formed '
+                             'and every patch matches a resource, without rendering anything. '
+                             'Input files are checked separately, in --jobs processes.')
+    parser.add_argument('--batch', dest='batch_file_path',
+                        help='Render every job in a batch manifest.')
+    parser.add_argument('--render-cache-dir', dest='render_cache_dir',
+                        help='Cache rendered output in this directory, and reuse it while no file in the input graph '
+                             'and no argument has changed.')
+    parser.add_argument('--render-cache-max-size', dest='render_cache_max_size', type=int,
+                        help='Evict least recently used render cache entries past this many bytes. '
+                             'Defaults to 256 MiB.')
+    parser.add_argument('--since', dest='since_path',
+                        help='Only output resources that were added or changed since this previous output. '
+                             'Resources are matched by apiVersion, kind, namespace and name. '
+                             'Bypasses --render-cache-dir.')
+    parser.add_argument('--print-deleted', dest='print_deleted', action='store_true',
+                        help='With --since, list resources in the previous output that are no longer rendered '
+                             'on stderr.')
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='Ignore --cache-dir and --render-cache-dir, and parse every file.')
+
+    return parser
+
+
+def main(argv=None, cache=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv[:1] == ['serve']:
+        from konfigenetes.daemon import serve_main
+        sys.exit(serve_main(argv[1:]))
+    if argv[:1] == ['compile']:
+        from konfigenetes.bundle import compile_main
+        sys.exit(compile_main(argv[1:]))
+    if argv[:1] == ['render']:
+        from konfigenetes.bundle import render_main
+        sys.exit(render_main(argv[1:]))
+
+    # Forward to a render daemon if there is one, unless this is the daemon.
+    # The daemon parses the arguments, so forwarding doesn't import the library or argparse.
+    socket_path = find_socket_path(argv)
+    if cache is None and socket_path and '--watch' not in argv:
+        from konfigenetes.daemon import forward
+        exit_code = forward(socket_path, argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    args = make_parser().parse_args(argv)
+
+    if args.profile is not None:
+        from konfigenetes.profiling import Profiler
+        with Profiler(trace_memory=args.profile_memory) as profiler:
+            try:
+                render(args, cache=cache)
+            finally:
+                print(profiler.format_json() if args.profile == 'json' else profiler.format_text(),
+                      file=sys.stderr)
+    else:
+        render(args, cache=cache)
+
+
+def find_socket_path(argv):
+    """Find the daemon socket from --socket or $KONFIGENETES_SOCKET, without parsing the rest of argv."""
+    for index, arg in enumerate(argv):
+        if arg == '--':
+            break
+        if arg == '--socket' and index + 1 < len(argv):
+            return argv[index + 1]
+        if arg.startswith('--socket='):
+            return arg[len('--socket='):]
+    return os.environ.get('KONFIGENETES_SOCKET', None)
+
+
+def render(args, cache=None):
+    from konfigenetes.konfigenetes import (format_input_graph, iter_konfigured_resources, parse_var_values,
+                                           resolve_input_files)
+    from konfigenetes.profiling import phase
+
+    if args.batch_file_path is not None:
+        from konfigenetes.batch import run_batch
+        sys.exit(run_batch(args.batch_file_path, processes=args.jobs))
+
+    if args.check:
+        from konfigenetes.check import run_checks
+        sys.exit(run_checks(args.input_file_paths, args.resource_file_paths, args.patch_file_paths,
+                            parse_var_values(args.var_values or []), processes=args.jobs))
+
+    if args.print_graph:
+        try:
+            input_data = resolve_input_files(args.input_file_paths or [], jobs=args.jobs or 1)
+        except ValueError as e:
+            print('Fatal Error:\n{}'.format(e))
+            sys.exit(1)
+        print(format_input_graph(input_data['graph']))
+        return
+
+    if args.watch:
+        from konfigenetes.watch import watch
+        try:
+            watch(args.input_file_paths, args.resource_file_paths, args.patch_file_paths,
+                  parse_var_values(args.var_values or []), output_path=args.output_file_path,
+                  output_format=args.output_format, interval=args.watch_interval)
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+    if (args.render_cache_dir is not None and not args.no_cache and args.since_path is None and
+            args.output_dir is None):
+        render_cached(args, cache=cache)
+        return
+
+    if args.since_path is not None and args.output_dir is not None:
+        # Files hold every resource of their layout, so they can't be written from only the changed ones.
+        print('Fatal Error:\n--since can\'t be used with --output-dir, '
+              'which already leaves files whose content is unchanged alone.')
+        sys.exit(1)
+
+    resource_diff = None
+    if args.since_path is not None:
+        from konfigenetes.diff import ResourceDiff, load_previous_output
+        try:
+            resource_diff = ResourceDiff(load_previous_output(args.since_path))
+        except (OSError, ValueError) as e:
+            print('Fatal Error:\nCould not read previous output {}: {}'.format(args.since_path, e))
+            sys.exit(1)
+
+    raw_passthrough = (args.raw_passthrough and args.output_format == 'yaml' and resource_diff is None and
+                       args.output_dir is None)
+
+    try:
+        konfigured_resources = iter_konfigured_resources(
+            args.input_file_paths,
+            args.resource_file_paths,
+            args.patch_file_paths,
+            parse_var_values(args.var_values or []),
+            cache_dir=None if args.no_cache else args.cache_dir,
+            cache_max_size=args.cache_max_size,
+            jobs=args.jobs or 1,
+            cache=cache,
+            raw_passthrough=raw_passthrough)
+        # Generate the first resource now, so errors are reported before any output is written.
+        import itertools
+        konfigured_resources = itertools.chain([next(konfigured_resources)], konfigured_resources)
+    except StopIteration:
+        konfigured_resources = []
+    except ValueError as e:
+        print('Fatal Error:\n{}'.format(e))
+        sys.exit(1)
+    if resource_diff is not None:
+        konfigured_resources = resource_diff.changed(konfigured_resources)
+
+    if args.output_dir is not None:
+        from konfigenetes.output_dir import write_output_dir
+        with phase('dump'):
+            written_paths, unchanged_paths, removed_paths = write_output_dir(
+                konfigured_resources, args.output_dir, layout=args.output_layout,
+                output_format=args.output_format, processes=args.jobs, prune=args.prune)
+        for removed_path in removed_paths:
+            print('Removed {}'.format(removed_path), file=sys.stderr)
+        print('Wrote {} files to {} ({} unchanged, {} removed)'.format(
+            len(written_paths), args.output_dir, len(unchanged_paths), len(removed_paths)), file=sys.stderr)
+    else:
+        # Stream each document out as it is serialized.
+        # Vars are substituted into each resource as it is dumped, so dump includes substitute.
+        with phase('dump'):
+            if args.output_file_path is None:
+                write_output(konfigured_resources, args.output_format, sys.stdout, raw_passthrough)
+            else:
+                with open(args.output_file_path, 'w') as output_file:
+                    write_output(konfigured_resources, args.output_format, output_file, raw_passthrough)
+
+    if resource_diff is not None and args.print_deleted:
+        from konfigenetes.diff import format_resource_id
+        for deleted_id in resource_diff.deleted():
+            print('Deleted {}'.format(format_resource_id(deleted_id)), file=sys.stderr)
+
+
+def write_output(konfigured_resources, output_format, stream, raw_passthrough=False):
+    if raw_passthrough:
+        from konfigenetes.passthrough import dump_passthrough_output
+        dump_passthrough_output(konfigured_resources, stream)
+    else:
+        from konfigenetes.konfigenetes import dump_output
+        dump_output(konfigured_resources, output_format=output_format, stream=stream)
+
+
+def render_cached(args, cache=None):
+    from konfigenetes.konfigenetes import parse_var_values
+    from konfigenetes.render_cache import RenderCache
+
+    render_cache = RenderCache(args.render_cache_dir, max_size=args.render_cache_max_size)
+    if cache is None and args.cache_dir is not None:
+        from konfigenetes.parse_cache import ParseCache
+        cache = ParseCache(args.cache_dir, max_size=args.cache_max_size)
+    try:
+        output, hit = render_cache.render(
+            args.input_file_paths,
+            args.resource_file_paths,
+            args.patch_file_paths,
+            parse_var_values(args.var_values or []),
+            output_format=args.output_format,
+            jobs=args.jobs or 1,
+            cache=cache)
+    except ValueError as e:
+        print('Fatal Error:\n{}'.format(e))
+        sys.exit(1)
+    print('Render cache {}'.format('hit' if hit else 'miss'), file=sys.stderr)
+
+    if args.output_file_path is None:
+        sys.stdout.write(output)
+    else:
+        with open(args.output_file_path, 'w') as output_file:
+            output_file.write(output)
+
+
+if __name__ == '__main__':
+    main()
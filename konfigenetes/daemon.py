@@ -0,0 +1,154 @@
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+
+# Keep imports light: forward() runs on every client invocation.
+
+
+def forward(socket_path, argv):
+    """
+    Forward a command line to the render daemon listening on socket_path, and print its output.
+    Returns the exit code, or None if no daemon is running or it didn't send back a whole response,
+    in which case the caller renders in-process.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+            client.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode('utf-8'))
+            client.shutdown(socket.SHUT_WR)
+            response_bytes = b''.join(iter(lambda: client.recv(65536), b''))
+        except OSError:
+            return None
+
+    try:
+        response = json.loads(response_bytes.decode('utf-8'))
+    except ValueError:
+        # Empty or truncated, if the daemon died while rendering.
+        return None
+    if not isinstance(response, dict) or not {'stdout', 'stderr', 'exit_code'} <= response.keys():
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['exit_code']
+
+
+def serve_main(argv):
+    import argparse
+
+    serve_parser = argparse.ArgumentParser(
+        prog='konfigenetes serve',
+        description='Render on request from a local socket, keeping parsed files in memory between renders.')
+    serve_parser.add_argument('--socket', dest='socket_path', required=True)
+    serve_parser.add_argument('--cache-max-size', dest='cache_max_size', type=int,
+                              help='Evict least recently used parsed files past this many bytes held in memory. '
+                                   'Defaults to 256 MiB.')
+    args = serve_parser.parse_args(argv)
+
+    try:
+        server = RenderServer(args.socket_path, cache_max_size=args.cache_max_size)
+    except ValueError as e:
+        print('Fatal Error:\n{}'.format(e), file=sys.stderr)
+        return 1
+
+    # Clean up the socket when stopped, as well as on ctrl-c.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print('Listening on {}'.format(args.socket_path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+class RenderServer(socketserver.UnixStreamServer):
+    """
+    Renders command lines sent by forward(), one at a time.
+    Parsed files are kept in a MemoryCache of up to cache_max_size bytes,
+    which re-reads a file when its mtime or size changes.
+    """
+
+    def __init__(self, socket_path, cache_max_size=None):
+        from konfigenetes.parse_cache import DEFAULT_MAX_SIZE, MemoryCache
+
+        if os.path.exists(socket_path):
+            if forward_probe(socket_path):
+                raise ValueError('A daemon is already listening on {}.'.format(socket_path))
+            # Left behind by a daemon that didn't shut down cleanly.
+            os.remove(socket_path)
+
+        self.socket_path = socket_path
+        self.cache = MemoryCache(max_size=DEFAULT_MAX_SIZE if cache_max_size is None else cache_max_size)
+        super().__init__(socket_path, RenderRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def render(self, argv, cwd):
+        from konfigenetes.cli import main, make_parser
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = 0
+        previous_cwd = os.getcwd()
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    # Relative paths are relative to the client. Requests are handled one at a time, so this is safe.
+                    os.chdir(cwd)
+                    if make_parser().parse_args(argv).watch:
+                        print('Fatal Error:\n--watch can\'t be run in the daemon.', file=sys.stderr)
+                        exit_code = 1
+                    else:
+                        main(argv, cache=self.cache)
+                except SystemExit as e:
+                    if isinstance(e.code, int):
+                        exit_code = e.code
+                    elif e.code is not None:
+                        print(e.code, file=sys.stderr)
+                        exit_code = 1
+                except Exception:
+                    traceback.print_exc()
+                    exit_code = 1
+        finally:
+            os.chdir(previous_cwd)
+
+        return {
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+            'exit_code': exit_code,
+        }
+
+
+class RenderRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_bytes = self.rfile.read()
+        if not request_bytes:
+            # Probed to see if the daemon is running.
+            return
+        request = json.loads(request_bytes.decode('utf-8'))
+        response = self.server.render(request['argv'], request['cwd'])
+        self.wfile.write(json.dumps(response).encode('utf-8'))
+
+
+def forward_probe(socket_path):
+    """Check whether anything is listening on socket_path."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        return False
+    finally:
+        probe.close()
+    return True
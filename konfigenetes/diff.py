@@ -0,0 +1,85 @@
+import hashlib
+import json
+
+
+def resource_id(resource):
+    """Identify a resource by (apiVersion, kind, namespace, name)."""
+    metadata = resource.get('metadata', None) or {}
+    return (resource.get('apiVersion', None), resource.get('kind', None),
+            metadata.get('namespace', None), metadata.get('name', None))
+
+
+def format_resource_id(resource_id):
+    api_version, kind, namespace, name = resource_id
+    if namespace is None:
+        return '{} {}/{}'.format(api_version, kind, name)
+    return '{} {}/{}/{}'.format(api_version, kind, namespace, name)
+
+
+def resource_hash(resource):
+    """
+    Hash a resource's content.
+    Keys are sorted, so resources that differ only in key order hash the same.
+    """
+    canonical = json.dumps(resource, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def load_previous_output(file_path):
+    """
+    Load the resources in a previous output, in any of the output formats:
+    YAML documents, a JSON List, or one JSON object per line. Raises ValueError if it can't be parsed.
+    """
+    with open(file_path, 'r') as previous_file:
+        content = previous_file.read()
+
+    if content.lstrip().startswith('{'):
+        try:
+            documents = [json.loads(content)]
+        except ValueError:
+            # More than one object, so newline-delimited JSON.
+            try:
+                documents = [json.loads(line) for line in content.splitlines() if line.strip()]
+            except ValueError as e:
+                raise ValueError('{} is not valid JSON or newline-delimited JSON: {}'.format(file_path, e))
+    else:
+        import yaml
+        from konfigenetes.konfigenetes import parse_yaml_documents
+        try:
+            documents = parse_yaml_documents(content)
+        except yaml.YAMLError as e:
+            raise ValueError('{} is not valid YAML: {}'.format(file_path, e))
+
+    resources = []
+    for document in documents:
+        # --output json wraps resources in a List.
+        if (type(document) == dict and document.get('kind', None) == 'List' and
+                type(document.get('items', None)) == list):
+            resources += document['items']
+        else:
+            resources.append(document)
+    return resources
+
+
+class ResourceDiff:
+    """
+    Compares rendered resources against a previous render.
+    changed() filters resources as they are rendered, so output can still be streamed.
+    Once it is exhausted, deleted() lists resources in the previous render that are gone.
+    """
+
+    def __init__(self, previous_resources):
+        self.previous_hashes = dict((resource_id(resource), resource_hash(resource))
+                                    for resource in previous_resources if resource is not None)
+        self.seen_ids = set()
+
+    def changed(self, resources):
+        """Yield the resources that were added or changed since the previous render."""
+        for resource in resources:
+            current_id = resource_id(resource)
+            self.seen_ids.add(current_id)
+            if self.previous_hashes.get(current_id, None) != resource_hash(resource):
+                yield resource
+
+    def deleted(self):
+        return [previous_id for previous_id in self.previous_hashes if previous_id not in self.seen_ids]
@@ -1,35 +1,93 @@
-import argparse
-import pprint
-import sys
+import functools
+import io
+import os
+import re
 from pathlib import Path
 
 import yaml
 
-parser = argparse.ArgumentParser(description='Konfigenetes configures Kubernetes resources dynamically.')
-parser.add_argument('-f', '--input-file', dest='input_file_paths', action='append')
-parser.add_argument('-r', '--add-resource', dest='resource_file_paths', action='append')
-parser.add_argument('-p', '--add-patch', dest='patch_file_paths', action='append')
-parser.add_argument('-s', '--set-var', dest='var_values', action='append')
+from konfigenetes.profiling import phase
 
+# Prefer the libyaml bindings, which are much faster than pure Python PyYAML.
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+    YAML_BACKEND = 'libyaml'
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+    YAML_BACKEND = 'python'
 
-def main():
-    args = parser.parse_args()
+OUTPUT_FORMATS = ['yaml', 'json', 'ndjson']
+# How --output-dir splits resources into files.
+OUTPUT_LAYOUTS = ['resource', 'kind']
 
-    try:
-        konfigured_resources = konfigenetes(
-            args.input_file_paths,
-            args.resource_file_paths,
-            args.patch_file_paths,
-            parse_var_values(args.var_values))
-    except ValueError as e:
-        print('Fatal Error:\n{}'.format(e))
-        sys.exit(1)
 
-    print(yaml.safe_dump_all(konfigured_resources, explicit_start=True))
+def konfigenetes(input_file_paths=None, resource_file_paths=None,
+                 patch_file_paths=None, var_values=None,
+                 cache_dir=None, cache_max_size=None, jobs=1, cache=None, raw_passthrough=False):
+    return list(iter_konfigured_resources(
+        input_file_paths, resource_file_paths, patch_file_paths, var_values,
+        cache_dir=cache_dir, cache_max_size=cache_max_size, jobs=jobs, cache=cache, raw_passthrough=raw_passthrough))
 
 
-def konfigenetes(input_file_paths=None, resource_file_paths=None,
-                 patch_file_paths=None, var_values=None):
+def iter_konfigured_resources(input_file_paths=None, resource_file_paths=None,
+                              patch_file_paths=None, var_values=None,
+                              cache_dir=None, cache_max_size=None, jobs=1, cache=None, raw_passthrough=False):
+    """
+    Generate konfigured resources one at a time.
+    Everything that can fail is checked before the first resource is generated,
+    and vars are substituted into each resource only as it is generated.
+    With raw_passthrough, resource documents that no patch targets and that have no vars in them
+    are generated as passthrough.RawDocuments instead of being parsed.
+    """
+    if var_values is None:
+        var_values = {}
+
+    if cache is None and cache_dir is not None:
+        from konfigenetes.parse_cache import ParseCache
+        cache = ParseCache(cache_dir, max_size=cache_max_size)
+
+    resources, input_var_values, resources_need_vars = load_patched_resources(
+        input_file_paths, resource_file_paths, patch_file_paths, cache=cache, jobs=jobs,
+        raw_passthrough=raw_passthrough)
+
+    # Add newly parsed var values to those passed in.
+    # The order of dicts is important: New passed in vars must override the vars in the files.
+    var_values = dict(input_var_values, **var_values)
+
+    yield from substitute_resources(resources, resources_need_vars, var_values)
+
+
+def substitute_resources(resources, resources_need_vars, var_values):
+    """
+    Check every var the resources need is set, then generate each resource with vars substituted into it.
+    Only resources that need vars are searched for them.
+    """
+    with phase('find_vars'):
+        # Resources without vars don't need to be searched.
+        resource_string_var_lists = [find_string_var_lists_recursive(resource) if needs_vars else []
+                                     for resource, needs_vars in zip(resources, resources_need_vars)]
+
+        var_names = set([needed_var for string_var_lists in resource_string_var_lists
+                         for string_var_list in string_var_lists
+                         for needed_var in string_var_list.needed_vars])
+        check_missing_vars(var_names, var_values)
+
+    for resource, string_var_lists in zip(resources, resource_string_var_lists):
+        with phase('substitute'):
+            for string_var_list in string_var_lists:
+                string_var_list.save(var_values)
+        yield resource
+
+
+def load_patched_resources(input_file_paths=None, resource_file_paths=None, patch_file_paths=None,
+                           cache=None, jobs=1, raw_passthrough=False, patch_targets=None):
+    """
+    Load resources and apply patches to them.
+    Returns the patched resources, the var values set in input files,
+    and whether each resource has strings with vars in it.
+    If patch_targets is a list, each patch and the list of resources it matched are added to it.
+    """
     if input_file_paths is None:
         input_file_paths = []
 
@@ -39,69 +97,67 @@ def konfigenetes(input_file_paths=None, resource_file_paths=None,
     if patch_file_paths is None:
         patch_file_paths = []
 
-    if var_values is None:
-        var_values = {}
+    with phase('resolve_inputs'):
+        input_data = resolve_input_files(input_file_paths, cache=cache, jobs=jobs)
 
-    resource_file_paths_from_inputs = []
-    patch_file_paths_from_inputs = []
-    var_values_raw_from_inputs = []
+    # Config passed into the function should take precedence (be applied after)
+    # the config taken from input files.
+    resource_file_paths = input_data['resource_file_paths'] + resource_file_paths
+    patch_file_paths = input_data['patch_file_paths'] + patch_file_paths
 
-    visited_input_files = set()
-    new_input_files = input_file_paths
+    with phase('load'):
+        if raw_passthrough:
+            from konfigenetes.passthrough import load_passthrough_resource_files
+            resources, patches = load_passthrough_resource_files(
+                resource_file_paths, patch_file_paths, cache=cache, jobs=jobs)
+        else:
+            document_lists = load_resource_files(resource_file_paths + patch_file_paths, cache=cache, jobs=jobs)
+            resources = [resource for resource_list in document_lists[:len(resource_file_paths)]
+                         for resource in resource_list]
+            patches = [patch for patch_list in document_lists[len(resource_file_paths):]
+                       for patch in patch_list]
 
-    while len(new_input_files) > 0:
-        input_file_paths = new_input_files
-        new_input_files = []
+    var_values = parse_var_values(input_data['var_values_raw'])
 
-        for input_file_path in input_file_paths:
-            if input_file_path in visited_input_files:
-                # Prevent cycle.
-                continue
+    resources, resources_need_vars = patch_resources(resources, patches, raw_passthrough=raw_passthrough,
+                                                     patch_targets=patch_targets)
+    return resources, var_values, resources_need_vars
 
-            input_file_data = read_input_file(input_file_path)
-            visited_input_files.add(input_file_path)
 
-            new_input_files += input_file_data['input_file_paths']
-            resource_file_paths_from_inputs += input_file_data['resource_file_paths']
-            patch_file_paths_from_inputs += input_file_data['patch_file_paths']
-            var_values_raw_from_inputs += input_file_data['var_values_raw']
-
-    # Config passed into the function should take precedence (be applied after)
-    # the config taken from input files.
-    resource_file_paths = resource_file_paths_from_inputs + resource_file_paths
-    patch_file_paths = patch_file_paths_from_inputs + patch_file_paths
-    var_values_raw = var_values_raw_from_inputs
-
-    resources = []
-    for resource_file_path in resource_file_paths:
-        with open(resource_file_path, 'r') as resource_file:
-            resources += list(filter(
-                lambda r: r is not None,
-                yaml.safe_load_all(resource_file)))
-    patches = []
-    for patch_file_path in patch_file_paths:
-        with open(patch_file_path, 'r') as patch_file:
-            patches += list(filter(
-                lambda p: p is not None,
-                yaml.safe_load_all(patch_file)))
+def patch_resources(resources, patches, raw_passthrough=False, patch_targets=None):
+    """
+    Apply patches to resources, both given as (document, needs vars) pairs.
+    Returns the patched resources, and whether each has strings with vars in it.
+    If patch_targets is a list, each patch and the list of resources it matched are added to it.
+    """
+    with phase('patch'):
+        if raw_passthrough:
+            from konfigenetes.passthrough import RawDocument
+            patchable_resources = [resource for resource, _ in resources if not isinstance(resource, RawDocument)]
+        else:
+            patchable_resources = [resource for resource, _ in resources]
+        patch_target_lists = apply_patches(patchable_resources, [patch for patch, _ in patches])
+    if patch_targets is not None:
+        patch_targets += [(patch, targets) for (patch, _), targets in zip(patches, patch_target_lists)]
 
-    # Add newly parsed var values to those passed in.
-    # The order of dicts is important: New passed in vars must override the vars in the files.
-    var_values = dict(
-        parse_var_values(var_values_raw),
-        **var_values)
+    return [resource for resource, _ in resources], find_resources_need_vars(resources, patches, patch_target_lists)
 
-    apply_patches(resources, patches)
 
-    string_var_lists = None
-    for resource in resources:
-        string_var_lists = find_string_var_lists_recursive(resource, string_var_lists=string_var_lists)
+def find_resources_need_vars(resources, patches, patch_targets):
+    """
+    Find whether each patched resource has strings with vars in it: if it had any when loaded,
+    or if a patch with vars was applied to it.
+    """
+    resource_positions = dict((id(resource), i) for i, (resource, _) in enumerate(resources))
+    resources_need_vars = [needs_vars for _, needs_vars in resources]
+    for (_, patch_needs_vars), targets in zip(patches, patch_targets):
+        if patch_needs_vars:
+            for resource in targets:
+                resources_need_vars[resource_positions[id(resource)]] = True
+    return resources_need_vars
 
-    if string_var_lists is None:
-        string_var_lists = []
 
-    var_names = set([needed_var for string_var_list in string_var_lists
-                     for needed_var in string_var_list.needed_vars])
+def check_missing_vars(var_names, var_values):
     missing_vars = []
     for var_name in var_names:
         if var_name not in var_values:
@@ -113,10 +169,68 @@ def konfigenetes(input_file_paths=None, resource_file_paths=None,
             missing_var_error += '  Missing var: {{{{ {} }}}}\n'.format(missing_var)
         raise ValueError(missing_var_error)
 
-    for string_var_list in string_var_lists:
-        string_var_list.save(var_values)
 
-    return resources
+def resolve_input_files(input_file_paths, cache=None, jobs=1):
+    """
+    Read input files and the input files they include, breadth first.
+    Input files are deduplicated by their canonical path, and each level of the graph is read in parallel.
+    Returns the input files visited, and the resource files, patch files and raw vars they list, in order,
+    along with the graph of what each input file lists.
+    """
+    visited_input_file_paths = []
+    resource_file_paths = []
+    patch_file_paths = []
+    var_values_raw = []
+    graph = []
+
+    visited_input_files = set()
+    new_input_files = input_file_paths
+
+    while len(new_input_files) > 0:
+        input_file_paths = []
+        for input_file_path in new_input_files:
+            canonical_input_file_path = os.path.realpath(input_file_path)
+            if canonical_input_file_path in visited_input_files:
+                # Prevent cycle, and reading the same file through different paths.
+                continue
+            visited_input_files.add(canonical_input_file_path)
+            input_file_paths.append(input_file_path)
+
+        input_file_datas = map_in_threads(
+            lambda input_file_path: read_input_file(input_file_path, cache=cache), input_file_paths, jobs)
+        new_input_files = []
+
+        for input_file_path, input_file_data in zip(input_file_paths, input_file_datas):
+            visited_input_file_paths.append(input_file_path)
+            graph.append(dict(input_file_data, input_file_path=input_file_path))
+
+            new_input_files += input_file_data['input_file_paths']
+            resource_file_paths += input_file_data['resource_file_paths']
+            patch_file_paths += input_file_data['patch_file_paths']
+            var_values_raw += input_file_data['var_values_raw']
+
+    return {
+        'input_file_paths': visited_input_file_paths,
+        'resource_file_paths': resource_file_paths,
+        'patch_file_paths': patch_file_paths,
+        'var_values_raw': var_values_raw,
+        'graph': graph,
+    }
+
+
+def format_input_graph(graph):
+    """Format the graph of input files for --print-graph, with how much each input file fans out to."""
+    lines = []
+    for input_file_data in graph:
+        lines.append('{} ({} inputs, {} resources, {} patches, {} vars)'.format(
+            input_file_data['input_file_path'], len(input_file_data['input_file_paths']),
+            len(input_file_data['resource_file_paths']), len(input_file_data['patch_file_paths']),
+            len(input_file_data['var_values_raw'])))
+        for key, label in [('input_file_paths', 'input'), ('resource_file_paths', 'resource'),
+                           ('patch_file_paths', 'patch')]:
+            for file_path in input_file_data[key]:
+                lines.append('  {}: {}'.format(label, file_path))
+    return '\n'.join(lines)
 
 
 def parse_var_values(var_values_raw):
@@ -129,39 +243,230 @@ def parse_var_values(var_values_raw):
     return var_values
 
 
-def read_input_file(input_file_path):
+def load_resource_files(file_paths, cache=None, jobs=1):
+    """
+    Load the resources or patches in each file, returning one list per file.
+    Each list holds a (document, needs vars) pair per document.
+    """
+    return map_in_threads(lambda file_path: load_resource_documents(file_path, cache=cache), file_paths, jobs)
+
+
+def map_in_threads(function, items, jobs=1):
+    """
+    Call function on each item, in a thread pool when jobs > 1.
+    Results keep the order of items either way.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(function, items))
+
+
+def load_yaml_documents(file_path, cache=None):
+    """Load the non-empty YAML documents in a file. Files ending in .json are loaded as JSON."""
+    if is_json_file(file_path):
+        kind, parse = 'json_documents', parse_json_documents
+    else:
+        kind, parse = 'documents', parse_yaml_documents
+    with phase('load_file', file=file_path):
+        if cache is not None:
+            return cache.load(file_path, kind, parse)
+        with open(file_path, 'r') as yaml_file:
+            return parse(yaml_file)
+
+
+def load_resource_documents(file_path, cache=None):
+    """
+    Load the non-empty YAML documents in a file, along with whether each has strings with vars in it.
+    Files ending in .json are loaded as JSON.
+    """
+    if is_json_file(file_path):
+        kind, parse = 'json_resource_documents', parse_json_resource_documents
+    else:
+        kind, parse = 'resource_documents', parse_resource_documents
+    with phase('load_file', file=file_path):
+        if cache is not None:
+            return cache.load(file_path, kind, parse)
+        with open(file_path, 'r') as yaml_file:
+            return parse(yaml_file)
+
+
+def is_json_file(file_path):
+    return str(file_path).lower().endswith('.json')
+
+
+class VarSiteLoader(SafeLoader):
+    """
+    SafeLoader that records which documents have strings with vars in them while they are parsed,
+    so documents without vars never have to be searched for them.
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.document_needs_vars = False
+        self.documents_need_vars = []
+
+    def construct_document(self, node):
+        self.document_needs_vars = False
+        document = super().construct_document(node)
+        self.documents_need_vars.append(self.document_needs_vars)
+        return document
+
+    def construct_var_string(self, node):
+        value = self.construct_scalar(node)
+        if '{{' in value:
+            self.document_needs_vars = True
+        return value
+
+
+VarSiteLoader.add_constructor('tag:yaml.org,2002:str', VarSiteLoader.construct_var_string)
+
+
+def parse_resource_documents(stream, loader=VarSiteLoader):
+    var_site_loader = loader(stream)
+    try:
+        documents = []
+        while var_site_loader.check_data():
+            documents.append(var_site_loader.get_data())
+    finally:
+        var_site_loader.dispose()
+    return [(document, needs_vars) for document, needs_vars in zip(documents, var_site_loader.documents_need_vars)
+            if document is not None]
+
+
+def parse_yaml_documents(stream, loader=SafeLoader):
+    return [document for document in yaml.load_all(stream, Loader=loader) if document is not None]
+
+
+def parse_json_documents(stream):
+    """Parse a JSON file holding either a single document or an array of documents."""
+    import json
+    content = stream.read() if hasattr(stream, 'read') else stream
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    data = json.loads(content)
+    documents = data if type(data) == list else [data]
+    return [document for document in documents if document is not None]
+
+
+def parse_json_resource_documents(stream):
+    content = stream.read() if hasattr(stream, 'read') else stream
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    # Only search documents for vars if the file has any.
+    needs_vars = '{{' in content
+    return [(document, needs_vars) for document in parse_json_documents(content)]
+
+
+def parse_yaml_document(stream, loader=SafeLoader):
+    return yaml.load(stream, Loader=loader)
+
+
+def dump_yaml_documents(documents, dumper=SafeDumper, stream=None):
+    """Dump documents to a string, or write them to stream as they are serialized."""
+    return yaml.dump_all(documents, stream=stream, Dumper=dumper, explicit_start=True)
+
+
+def dump_json_documents(documents, stream=None):
+    """Dump documents as a JSON List object, which kubectl accepts like a multi-document YAML file."""
+    import json
+    output = json.dumps({'apiVersion': 'v1', 'kind': 'List', 'items': list(documents)}, indent=2, default=str)
+    if stream is None:
+        return output
+    stream.write(output)
+
+
+def dump_ndjson_documents(documents, stream=None):
+    """Dump documents as one JSON object per line, writing each to stream as it is serialized."""
+    import json
+    if stream is None:
+        stream = io.StringIO()
+        dump_ndjson_documents(documents, stream=stream)
+        return stream.getvalue()
+    for document in documents:
+        stream.write(json.dumps(document, separators=(',', ':'), default=str))
+        stream.write('\n')
+
+
+def dump_output(documents, output_format='yaml', stream=None):
+    """
+    Dump documents in one of OUTPUT_FORMATS, ending with a newline, as the command line writes them.
+    Returns a string, or writes to stream as documents are serialized.
+    """
+    if stream is None:
+        stream = io.StringIO()
+        dump_output(documents, output_format=output_format, stream=stream)
+        return stream.getvalue()
+
+    if output_format == 'ndjson':
+        dump_ndjson_documents(documents, stream=stream)
+        return
+    if output_format == 'json':
+        dump_json_documents(documents, stream=stream)
+    else:
+        dump_yaml_documents(documents, stream=stream)
+    stream.write('\n')
+
+
+def write_file_atomically(file_path, content):
+    """
+    Write bytes to a file by renaming a temporary file over it, so readers never see a partial file.
+    The temporary file is created like open() creates files, so the file gets its mode from the umask.
+    """
+    temp_path = '{}.{}.tmp'.format(file_path, os.urandom(8).hex())
+    temp_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(temp_fd, 'wb') as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_yaml_document(file_path, cache=None):
+    """Load a file containing a single YAML document."""
+    if cache is not None:
+        return cache.load(file_path, 'document', parse_yaml_document)
+    with open(file_path, 'r') as yaml_file:
+        return parse_yaml_document(yaml_file)
+
+
+def read_input_file(input_file_path, cache=None):
     input_file_paths = []
     resource_file_paths = []
     patch_file_paths = []
     var_values_raw = []
 
-    with open(input_file_path, 'r') as input_file:
-        input_data = yaml.safe_load(input_file)
-        if input_data is None:
-            return
-
-        if 'inputs' in input_data:
-            if type(input_data['inputs']) != list:
-                raise ValueError('"inputs" in input file {} must be a list.'.format(input_file_path))
-            input_file_paths += [
-                str(Path(input_file_path).parent / new_input_file_path)
-                for new_input_file_path in input_data['inputs']]
-        if 'resources' in input_data:
-            if type(input_data['resources']) != list:
-                raise ValueError('"resources" in input file {} must be a list.'.format(input_file_path))
-            resource_file_paths += [
-                str(Path(input_file_path).parent / resource_file_path)
-                for resource_file_path in input_data['resources']]
-        if 'patches' in input_data:
-            if type(input_data['patches']) != list:
-                raise ValueError('"patches" in input file {} must be a list.'.format(input_file_path))
-            patch_file_paths += [
-                str(Path(input_file_path).parent / patch_file_path)
-                for patch_file_path in input_data['patches']]
-        if 'vars' in input_data:
-            if type(input_data['vars']) != list:
-                raise ValueError('"vars" in input file {} must be a list.'.format(input_file_path))
-            var_values_raw += input_data['vars']
+    with phase('read_input_file', file=input_file_path):
+        input_data = load_yaml_document(input_file_path, cache=cache)
+    if input_data is None:
+        return
+
+    if 'inputs' in input_data:
+        if type(input_data['inputs']) != list:
+            raise ValueError('"inputs" in input file {} must be a list.'.format(input_file_path))
+        input_file_paths += [
+            str(Path(input_file_path).parent / new_input_file_path)
+            for new_input_file_path in input_data['inputs']]
+    if 'resources' in input_data:
+        if type(input_data['resources']) != list:
+            raise ValueError('"resources" in input file {} must be a list.'.format(input_file_path))
+        resource_file_paths += [
+            str(Path(input_file_path).parent / resource_file_path)
+            for resource_file_path in input_data['resources']]
+    if 'patches' in input_data:
+        if type(input_data['patches']) != list:
+            raise ValueError('"patches" in input file {} must be a list.'.format(input_file_path))
+        patch_file_paths += [
+            str(Path(input_file_path).parent / patch_file_path)
+            for patch_file_path in input_data['patches']]
+    if 'vars' in input_data:
+        if type(input_data['vars']) != list:
+            raise ValueError('"vars" in input file {} must be a list.'.format(input_file_path))
+        var_values_raw += input_data['vars']
 
     return {
         'input_file_paths': input_file_paths,
@@ -172,117 +477,181 @@ def read_input_file(input_file_path):
 
 
 def apply_patches(resources, patches):
+    """Apply each patch to the resources it matches, returning the list of resources each patch matched."""
+    resource_index = index_resources(resources)
+    patch_targets_list = []
     for patch in patches:
         patch_name = patch.get('metadata', {}).get('name', None)
         patch_kind = patch.get('kind', None)
         if patch_name is None:
-            raise ValueError('metadata.name must be set in all patches. Patch: {}'.format(pprint.pformat(patch)))
+            raise ValueError('metadata.name must be set in all patches. Patch: {}'.format(pformat(patch)))
         if patch_kind is None:
-            raise ValueError('kind must be set in all patches. Patch: {}'.format(pprint.pformat(patch)))
-        for resource in resources:
-            resource_name = resource.get('metadata', {}).get('name', None)
-            resource_kind = resource.get('kind', None)
-            if patch_name == resource_name and patch_kind == resource_kind:
+            raise ValueError('kind must be set in all patches. Patch: {}'.format(pformat(patch)))
+        patch_namespace = patch.get('metadata', {}).get('namespace', None)
+        with phase('apply_patch', patch='{}/{}'.format(patch_kind, patch_name)) as patch_details:
+            patch_targets = find_patch_targets(resource_index, patch_kind, patch_name, patch_namespace)
+            patch_details['matched'] = len(patch_targets)
+            for resource in patch_targets:
                 apply_patch_recursive(resource, patch)
+        patch_targets_list.append(patch_targets)
+
+    return patch_targets_list
+
 
+def pformat(value):
+    # pprint is only needed for error messages, so it is only imported for them.
+    import pprint
+    return pprint.pformat(value)
 
-def find_string_var_lists_recursive(resource, string_var_lists=None):
+
+def index_resources(resources):
+    """
+    Index resources by (kind, metadata.name), keeping resource order within each key.
+    Patches never change a resource's kind or name, so the index stays valid while patching.
+    """
+    resource_index = {}
+    for resource in resources:
+        resource_name = resource.get('metadata', {}).get('name', None)
+        resource_kind = resource.get('kind', None)
+        key = (resource_kind, resource_name)
+        if key in resource_index:
+            resource_index[key].append(resource)
+        else:
+            resource_index[key] = [resource]
+    return resource_index
+
+
+def find_patch_targets(resource_index, patch_kind, patch_name, patch_namespace=None):
+    """
+    Find the resources a patch applies to.
+    If the patch sets metadata.namespace, resources in other namespaces are skipped.
+    Resources without a namespace always match, so a patch can still set one.
+    If nothing in the patch's namespace matches, the patch applies to every resource of its kind and name,
+    as it always has, which moves them to the patch's namespace.
+    """
+    targets = resource_index.get((patch_kind, patch_name), [])
+    if patch_namespace is None:
+        return targets
+    namespace_targets = [resource for resource in targets
+                         if resource.get('metadata', {}).get('namespace', None) in (None, patch_namespace)]
+    return namespace_targets or targets
+
+
+def find_string_var_lists_recursive(resource, string_var_lists=None, errors=None):
+    """
+    Find every string in a resource that has vars in it.
+    Malformed var strings raise ValueError, or are added to errors and skipped if errors is a list.
+    """
     if string_var_lists is None:
         string_var_lists = []
 
-    for resource_key, resource_value in resource.items():
-        if type(resource_value) == dict:
-            find_string_var_lists_recursive(resource_value, string_var_lists=string_var_lists)
-        elif type(resource_value) == list:
-            for i in range(len(resource_value)):
-                item = resource_value[i]
-                if type(item) == dict:
-                    find_string_var_lists_recursive(item, string_var_lists=string_var_lists)
-                elif type(item) == str:
-                    string_var_list = StringVarList(item, {
-                        'list': resource_value,
-                        'index': i,
-                    })
-                    if string_var_list.needs_vars():
-                        string_var_lists.append(string_var_list)
-        elif type(resource_value) == str:
-            string_var_list = StringVarList(resource_value, {
-                'dict': resource,
-                'key': resource_key,
-            })
-            if string_var_list.needs_vars():
-                string_var_lists.append(string_var_list)
+    for container, key, _ in walk_var_strings(resource):
+        add_string_var_list(string_var_lists, container[key], container, key, errors)
 
     return string_var_lists
 
 
+def walk_var_strings(resource, path=None):
+    """
+    Yield (container, key, path) for every string in a resource that may have vars in it, so the string is
+    container[key]. Strings without "{{" are skipped without allocating.
+    path is the keys and indexes from the resource down to the string. It is only built if path is
+    the tuple to start from, such as ().
+    """
+    for resource_key, resource_value in resource.items():
+        value_type = type(resource_value)
+        if value_type == dict:
+            yield from walk_var_strings(resource_value, None if path is None else path + (resource_key,))
+        elif value_type == list:
+            for i, item in enumerate(resource_value):
+                item_type = type(item)
+                if item_type == dict:
+                    yield from walk_var_strings(item, None if path is None else path + (resource_key, i))
+                elif item_type == str and '{{' in item:
+                    yield resource_value, i, None if path is None else path + (resource_key, i)
+        elif value_type == str and '{{' in resource_value:
+            yield resource, resource_key, None if path is None else path + (resource_key,)
+
+
+def add_string_var_list(string_var_lists, string, container, key, errors=None):
+    try:
+        string_var_list = StringVarList(string, container, key)
+    except ValueError as e:
+        if errors is None:
+            raise
+        errors.append(e)
+        return
+    if string_var_list.needs_vars():
+        string_var_lists.append(string_var_list)
+
+
 class StringVarList:
-    def __init__(self, string, parent):
+    """
+    A string with vars in it, and the dict key or list index it is substituted back into.
+    One is kept for every var site in a render, so it has no per-instance dict.
+    """
+    __slots__ = ('string_parts', 'needed_vars', 'container', 'key')
+
+    def __init__(self, string, container=None, key=None):
         self.string_parts = self.extract_parts(string)
         self.needed_vars = [value for var_type, value in self.string_parts
                             if var_type == 'var']
-        self.parent = parent
+        self.container = container
+        self.key = key
 
     def needs_vars(self):
         return len(self.needed_vars) > 0
 
     def save(self, var_values):
-        if 'list' in self.parent:
-            self.parent['list'][self.parent['index']] = self.substitute_vars(var_values)
-        elif 'dict' in self.parent:
-            self.parent['dict'][self.parent['key']] = self.substitute_vars(var_values)
+        self.container[self.key] = self.substitute_vars(var_values)
 
     def substitute_vars(self, var_values):
-        substitution = []
-        for var_type, value in self.string_parts:
-            if var_type == 'text':
-                substitution.append(value)
-            elif var_type == 'var':
-                substitution.append(var_values[value])
-        return ''.join([str(value) for value in substitution])
+        return substitute_vars(self.string_parts, var_values)
 
     def extract_parts(self, string):
-        string_parts = []
-
-        outer_left_curly = False
-        inner_left_curly = False
-        inner_right_curly = False
-
-        text_string = ''
-        var_string = ''
-
-        for c in string:
-            if not outer_left_curly:
-                if c == '{':
-                    outer_left_curly = True
-                else:
-                    text_string += c
-            elif not inner_left_curly:
-                if c == '{':
-                    inner_left_curly = True
-                    string_parts.append(('text', text_string))
-                    text_string = ''
-                else:
-                    # Only one left curly, assume not a variable.
-                    outer_left_curly = False
-                    text_string += 'c'
-            elif not inner_right_curly:
-                if c == '}':
-                    inner_right_curly = True
-                    string_parts.append(('var', var_string.strip()))
-                    var_string = ''
-                else:
-                    var_string += c
-            else:
-                if c == '}':
-                    outer_left_curly = False
-                    inner_left_curly = False
-                    inner_right_curly = False
-                else:
-                    raise ValueError('Malformed var string: {}'.format(string))
+        return extract_string_parts(string)
+
+
+def extract_string_parts(string):
+    if '{{' not in string:
+        return (('text', string),)
+    return parse_string_parts(string)
+
+
+def substitute_vars(string_parts, var_values):
+    substitution = []
+    for var_type, value in string_parts:
+        if var_type == 'text':
+            substitution.append(value)
+        elif var_type == 'var':
+            substitution.append(var_values[value])
+    return ''.join([str(value) for value in substitution])
+
 
-        string_parts.append(('text', text_string))
-        return string_parts
+VAR_PATTERN = re.compile(r'\{\{([^}]*)\}(\}|\Z)?')
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_string_parts(string):
+    """
+    Split a string into ('text', ...) and ('var', ...) parts.
+    Parsed strings are cached, since the same labels and images repeat across resources.
+    """
+    string_parts = []
+    position = 0
+    while True:
+        match = VAR_PATTERN.search(string, position)
+        if match is None:
+            # Anything after the last var, including an unclosed {{, is plain text.
+            break
+        if match.group(2) is None:
+            raise ValueError('Malformed var string: {}'.format(string))
+        string_parts.append(('text', string[position:match.start()]))
+        string_parts.append(('var', match.group(1).strip()))
+        position = match.end()
+
+    string_parts.append(('text', string[position:]))
+    return tuple(string_parts)
 
 
 EXCLUDE_KEYS = {
@@ -330,40 +699,33 @@ def merge_lists_of_dicts(target_list, other_list):
     Merge two lists of dicts.
     If an item has a name key in list one,
     it will be merged with an item with the same name key in the second list.
+    Items in the second list without a match are appended to the first list.
     """
-    original_length = len(target_list)
-    target_list += other_list
-
     named_items = {}
     # Iterate through first list and remember items with a name.
-    for i in range(original_length):
-        item = target_list[i]
+    for item in target_list:
         if 'name' in item:
             name = item['name']
             if name in named_items:
-                named_items[name].append(i)
+                named_items[name].append(item)
             else:
-                named_items[name] = [i]
-
-    # Iterate through the rest of the list and update named items.
-    # If updated, remove the patched version from the list.
-    i = original_length
-    while i < len(target_list):
-        item = target_list[i]
-        if 'name' in item:
-            name = item['name']
-            if name in named_items:
-                for item_index in named_items[name]:
-                    for key in item.keys():
-                        if key in target_list[item_index] and type(item[key]) == list:
-                            merge_lists(target_list[item_index][key], item[key])
-                        else:
-                            target_list[item_index][key] = item[key]
-                del target_list[i]
-                # Don't increment i if we're splicing.
-                continue
-        i += 1
+                named_items[name] = [item]
+
+    # Update named items with the rest of the list, and append the items that matched nothing.
+    # The lists may be the same list, so iterate over a copy of the items to merge.
+    for item in list(other_list):
+        if 'name' in item and item['name'] in named_items:
+            item_values = [(key, value, type(value) == list) for key, value in item.items()]
+            for named_item in named_items[item['name']]:
+                for key, value, is_list in item_values:
+                    if is_list and key in named_item:
+                        merge_lists(named_item[key], value)
+                    else:
+                        named_item[key] = value
+        else:
+            target_list.append(item)
 
 
 if __name__ == '__main__':
+    from konfigenetes.cli import main
     main()
@@ -1,9 +1,41 @@
+import asyncio
+import contextlib
+import copy
+import datetime
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import yaml
 
 from konfigenetes import konfigenetes
+from konfigenetes.aio import konfigenetes_async
+from konfigenetes.batch import read_manifest, render_many
+from konfigenetes.bundle import BUNDLE_FORMAT_VERSION, BUNDLE_HEADER, BUNDLE_MAGIC, read_bundle, write_bundle
+from konfigenetes.check import check, check_many
+from konfigenetes.cli import find_socket_path
+from konfigenetes.daemon import RenderServer, forward
+from konfigenetes.diff import ResourceDiff, load_previous_output, resource_id
+from konfigenetes.konfigenetes import (StringVarList, dump_output, dump_yaml_documents,
+                                       find_string_var_lists_recursive, iter_konfigured_resources, merge_lists,
+                                       parse_resource_documents, parse_yaml_documents, resolve_input_files)
+from konfigenetes.output_dir import write_output_dir
+from konfigenetes.parse_cache import MemoryCache, ParseCache
+from konfigenetes.passthrough import RawDocument, dump_passthrough_output, split_documents
+from konfigenetes.profiling import Profiler, hooks
+from konfigenetes.render_cache import RenderCache
+from konfigenetes.template import compile_template
+from konfigenetes.watch import Watcher
 
 
 def test_data_file(filename):
@@ -201,3 +233,862 @@ class TestKonfigenetes(unittest.TestCase):
                          'TEST_VAR_6': 'not a variable { VAR_VALUE }'}
 
         self.assertEqual(konfigured_data, expected_data)
+
+    def test_namespaced_patch(self):
+        """Test a patch with a namespace only applies to resources in that namespace."""
+        konfigured_resources = konfigenetes(
+            resource_file_paths=[test_data_file('resources/namespaced.yml')],
+            patch_file_paths=[test_data_file('patches/production_log_level.yml')])
+
+        konfigured_log_levels = [(resource['metadata'].get('namespace'), resource['data']['LOG_LEVEL'])
+                                 for resource in konfigured_resources]
+        expected_log_levels = [
+            ('staging', 'debug'),
+            ('production', 'info'),
+            ('production', 'info'),
+        ]
+
+        self.assertEqual(konfigured_log_levels, expected_log_levels)
+
+    def test_namespaced_patch_moves_resource(self):
+        """Test a patch with a namespace no resource is in still applies by kind and name, moving the resource."""
+        konfigured_resources = konfigenetes(
+            resource_file_paths=[test_data_file('resources/staging_config.yml')],
+            patch_file_paths=[test_data_file('patches/production_log_level.yml')])
+
+        self.assertEqual(konfigured_resources, [{
+            'kind': 'ConfigMap',
+            'apiVersion': 'v1',
+            'metadata': {'name': 'app-config', 'namespace': 'production'},
+            'data': {'LOG_LEVEL': 'info'},
+        }])
+
+    def test_merge_lists_of_dicts(self):
+        """Test merging named items, including nested lists."""
+        target_list = [
+            {'name': 'a', 'value': '1', 'ports': [{'name': 'http', 'port': 80}]},
+            {'value': 'unnamed'},
+            {'name': 'b', 'value': '2'},
+        ]
+        other_list = [
+            {'name': 'a', 'ports': [{'name': 'http', 'port': 8080}, {'name': 'grpc', 'port': 9000}]},
+            {'name': 'c', 'value': '3'},
+            {'name': 'b', 'value': '4'},
+            {'name': 'c', 'value': '5'},
+        ]
+
+        merge_lists(target_list, other_list)
+        expected_list = [
+            {'name': 'a', 'value': '1', 'ports': [{'name': 'http', 'port': 8080}, {'name': 'grpc', 'port': 9000}]},
+            {'value': 'unnamed'},
+            {'name': 'b', 'value': '4'},
+            {'name': 'c', 'value': '3'},
+            {'name': 'c', 'value': '5'},
+        ]
+
+        self.assertEqual(target_list, expected_list)
+
+        # Items sharing a name share their merged lists, which are then merged into themselves.
+        target_list = [{'name': 'app'}, {'name': 'app'}]
+        merge_lists(target_list, [
+            {'name': 'app', 'env': [{'name': 'A'}]},
+            {'name': 'app', 'env': [{'name': 'B', 'ports': [{'containerPort': 1}]}, {'value': 'x'}]},
+        ])
+        expected_env = [
+            {'name': 'A'},
+            {'name': 'B', 'ports': [{'containerPort': 1}, {'containerPort': 1}]},
+            {'value': 'x'},
+            {'value': 'x'},
+        ]
+        self.assertEqual(target_list, [{'name': 'app', 'env': expected_env}, {'name': 'app', 'env': expected_env}])
+
+    def test_merge_lists_of_dicts_scaling(self):
+        """Test merging is linear: items are never spliced out of the list, and each name is compared a few times."""
+        class CountedName(str):
+            comparisons = 0
+
+            def __eq__(self, other):
+                CountedName.comparisons += 1
+                return str.__eq__(self, other)
+
+            __hash__ = str.__hash__
+
+        class AppendOnlyList(list):
+            def splice(self, *args):
+                raise AssertionError('Merged list was spliced.')
+
+            __delitem__ = pop = remove = insert = splice
+
+        size = 1000
+        target_list = AppendOnlyList({'name': CountedName('ENV_{}'.format(i)), 'value': 'VAL'} for i in range(size))
+        other_list = [{'name': CountedName('ENV_{}'.format(i)), 'value': 'NEW_VAL'} for i in range(size + 1)]
+        merge_lists(target_list, other_list)
+
+        self.assertEqual(target_list, [{'name': 'ENV_{}'.format(i), 'value': 'NEW_VAL'} for i in range(size + 1)])
+        self.assertLess(CountedName.comparisons, 4 * size)
+
+    def test_string_var_list(self):
+        """Test splitting strings into text and vars."""
+        string_var_list = StringVarList('{single} {{ VAR_VALUE }}-{{VAR_VALUE}} {', {})
+        self.assertEqual(string_var_list.needed_vars, ['VAR_VALUE', 'VAR_VALUE'])
+        self.assertEqual(string_var_list.substitute_vars({'VAR_VALUE': '1'}), '{single} 1-1 {')
+
+        self.assertFalse(StringVarList('not a variable { VAR_VALUE }', {}).needs_vars())
+
+        resource = {'data': {'KEY': '{{ VAR_VALUE }}', 'STATIC': 'static'}, 'args': ['static', 'x{{ VAR_VALUE }}']}
+        string_var_lists = find_string_var_lists_recursive(resource)
+        self.assertEqual(len(string_var_lists), 2)
+        self.assertFalse(hasattr(string_var_lists[0], '__dict__'))
+        for string_var_list in string_var_lists:
+            string_var_list.save({'VAR_VALUE': '1'})
+        self.assertEqual(resource, {'data': {'KEY': '1', 'STATIC': 'static'}, 'args': ['static', 'x1']})
+
+        with self.assertRaises(ValueError):
+            StringVarList('{{ VAR_VALUE }x}', {})
+
+    def test_jobs(self):
+        """Test loading files in parallel gives the same result as loading them in order."""
+        konfigured_resources = konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')])
+        for jobs in [2, 8]:
+            self.assertEqual(konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')], jobs=jobs),
+                             konfigured_resources)
+
+    def test_streaming_output(self):
+        """Test streaming resources writes the same bytes as dumping them all at once."""
+        output_stream = io.StringIO()
+        dump_yaml_documents(iter_konfigured_resources(input_file_paths=[test_data_file('inputs/input_file.yml')]),
+                            stream=output_stream)
+
+        self.assertEqual(output_stream.getvalue(), dump_yaml_documents(
+            konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')])))
+
+    def test_input_file_paths_deduplicated(self):
+        """Test an input file reached through different paths is only read once."""
+        input_file_paths = [test_data_file('inputs/input_file.yml'),
+                            test_data_file('resources/../inputs/input_file.yml')]
+        konfigured_resources = konfigenetes(input_file_paths=input_file_paths)
+
+        self.assertEqual(konfigured_resources, konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')]))
+
+        for jobs in [1, 4]:
+            input_data = resolve_input_files(input_file_paths, jobs=jobs)
+            self.assertEqual(input_data['input_file_paths'], [
+                test_data_file('inputs/input_file.yml'),
+                str(Path(test_data_file('inputs')) / 'child_input_file.yml'),
+            ])
+            self.assertEqual([len(input_file_data['resource_file_paths']) for input_file_data in input_data['graph']],
+                             [1, 1])
+
+    def test_json_files(self):
+        """Test JSON resource and patch files render like their YAML equivalents."""
+        with self.assertRaises(ValueError):
+            konfigenetes(
+                resource_file_paths=[test_data_file('resources/pod_and_service.json')],
+                patch_file_paths=[test_data_file('patches/var_port.json')])
+
+        self.assertEqual(
+            konfigenetes(
+                resource_file_paths=[test_data_file('resources/pod_and_service.json')],
+                patch_file_paths=[test_data_file('patches/var_port.json')],
+                var_values={'PORT': '8000'}),
+            konfigenetes(
+                resource_file_paths=[test_data_file('resources/pod_and_service.yml')],
+                patch_file_paths=[test_data_file('patches/var_port.yml')],
+                var_values={'PORT': '8000'}))
+
+    def test_json_output(self):
+        """Test JSON and NDJSON output hold the same resources as YAML output."""
+        konfigured_resources = konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')])
+
+        json_output = yaml.safe_load(dump_output(konfigured_resources, output_format='json'))
+        self.assertEqual(json_output['kind'], 'List')
+        self.assertEqual(json_output['items'], konfigured_resources)
+
+        ndjson_lines = dump_output(konfigured_resources, output_format='ndjson').splitlines()
+        self.assertEqual([yaml.safe_load(line) for line in ndjson_lines], konfigured_resources)
+
+    def test_documents_need_vars(self):
+        """Test documents with vars are marked when they are parsed."""
+        for filename, expected_needs_vars in [('resources/pod_and_service.yml', [False, False]),
+                                              ('resources/var_config.yml', [True]),
+                                              ('patches/var_port.yml', [True])]:
+            with open(test_data_file(filename)) as resource_file:
+                documents = parse_resource_documents(resource_file)
+            self.assertEqual([needs_vars for _, needs_vars in documents], expected_needs_vars)
+
+
+class TestResourceDiff(unittest.TestCase):
+    """Changed-only output tests"""
+
+    def test_changed_resources(self):
+        """Test only added and changed resources are output, ignoring key order, and deleted ones are listed."""
+        previous_resources = konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')])
+        # Same content with the keys in reverse order.
+        previous_resources[0] = dict(reversed(list(previous_resources[0].items())))
+        deleted_resource = previous_resources.pop()
+        resources = konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')],
+                                 var_values={'VAR_VALUE': '2'})
+        added_resource = copy.deepcopy(resources[0])
+        added_resource['metadata']['name'] = 'added'
+        resources.append(added_resource)
+
+        resource_diff = ResourceDiff(previous_resources)
+        changed_resources = list(resource_diff.changed(resources))
+
+        self.assertNotIn(resources[0], changed_resources)
+        self.assertIn(added_resource, changed_resources)
+        self.assertIn(resources[-2], changed_resources)
+        self.assertEqual(resource_diff.deleted(), [])
+
+        resource_diff = ResourceDiff(previous_resources + [deleted_resource])
+        list(resource_diff.changed(resources[:-2]))
+        self.assertEqual(resource_diff.deleted(), [resource_id(deleted_resource)])
+
+    def test_since_output_formats(self):
+        """Test --since reads a previous output in each output format."""
+        input_file_path = test_data_file('inputs/input_file.yml')
+        resources = konfigenetes(input_file_paths=[input_file_path])
+
+        for output_format in ['yaml', 'json', 'ndjson']:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                previous_output_path = str(Path(temp_dir) / 'previous')
+                with open(previous_output_path, 'w') as previous_output_file:
+                    dump_output(resources[:-1], output_format=output_format, stream=previous_output_file)
+                self.assertEqual(load_previous_output(previous_output_path), resources[:-1])
+
+                output_path = str(Path(temp_dir) / 'output')
+                completed_process = subprocess.run(
+                    [sys.executable, '-m', 'konfigenetes', '-f', input_file_path, '--output', output_format,
+                     '--since', previous_output_path, '--print-deleted', '-o', output_path],
+                    cwd=str(Path(__file__).parent.parent), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True, check=True)
+                self.assertEqual(load_previous_output(output_path), resources[-1:])
+                self.assertNotIn('Deleted', completed_process.stderr)
+
+
+class TestRawPassthrough(unittest.TestCase):
+    """Raw passthrough tests"""
+
+    def test_split_documents(self):
+        """Test documents are split and only those that are safe to copy get a kind and name."""
+        with open(test_data_file('resources/static_and_templated.yml')) as resource_file:
+            documents = split_documents(resource_file)
+
+        self.assertEqual([target for _, target in documents], [
+            ('ConfigMap', 'static-config'),
+            None,
+            ('Service', 'basic-service'),
+            None,
+        ])
+        self.assertTrue(documents[0][0].startswith('# Written out as is'))
+
+    def test_raw_passthrough(self):
+        """Test only documents without patches or vars are passed through, and the output loads the same."""
+        resource_file_paths = [test_data_file('resources/static_and_templated.yml')]
+        patch_file_paths = [test_data_file('patches/var_port.yml')]
+        var_values = {'VAR_VALUE': '1', 'PORT': '8000'}
+        konfigured_resources = konfigenetes(resource_file_paths=resource_file_paths,
+                                            patch_file_paths=patch_file_paths, var_values=var_values)
+        passthrough_resources = konfigenetes(resource_file_paths=resource_file_paths,
+                                             patch_file_paths=patch_file_paths, var_values=var_values,
+                                             raw_passthrough=True)
+
+        self.assertEqual([type(resource) for resource in passthrough_resources],
+                         [RawDocument, dict, dict, dict])
+        self.assertIn('ZED: last\n  ALPHA: first', passthrough_resources[0].text)
+        self.assertEqual(passthrough_resources[1:], konfigured_resources[1:])
+
+        output_stream = io.StringIO()
+        dump_passthrough_output(passthrough_resources, output_stream)
+        self.assertEqual(list(yaml.safe_load_all(output_stream.getvalue())), konfigured_resources)
+
+
+class TestCheck(unittest.TestCase):
+    """Check mode tests"""
+
+    def test_check(self):
+        """Test every unmatched patch, malformed var string and missing var is reported."""
+        self.assertEqual(check(input_file_paths=[test_data_file('inputs/input_file.yml')]), [])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.yml') as malformed_file:
+            malformed_file.write('kind: ConfigMap\nmetadata:\n  name: malformed\ndata:\n  KEY: "{{ BROKEN } text"\n')
+            malformed_file.flush()
+            errors = check(
+                resource_file_paths=[test_data_file('resources/var_config.yml'),
+                                     test_data_file('resources/pod_and_service.yml'),
+                                     malformed_file.name],
+                patch_file_paths=[test_data_file('patches/var_port.yml'),
+                                  test_data_file('patches/production_log_level.yml')])
+
+        self.assertEqual(errors, [
+            'Patch matched no resources: ConfigMap/app-config',
+            'Malformed var string: {{ BROKEN } text in ConfigMap/malformed',
+            'Missing var: {{ PORT }}',
+            'Missing var: {{ VAR_VALUE }}',
+        ])
+
+    def test_check_many(self):
+        """Test checks in a process pool match checks in process."""
+        jobs = [{'input_file_paths': [test_data_file('inputs/input_file.yml')]},
+                {'resource_file_paths': [test_data_file('resources/var_config.yml')]},
+                {'input_file_paths': [test_data_file('inputs/missing.yml')]}]
+
+        errors = check_many(jobs, processes=2)
+        self.assertEqual(errors, check_many(jobs, processes=1))
+        self.assertEqual([bool(job_errors) for job_errors in errors], [False, True, True])
+
+
+class TestAsync(unittest.TestCase):
+    """Asyncio render tests"""
+
+    def test_konfigenetes_async(self):
+        """Test async renders match konfigenetes() in threads and processes, with a limit on concurrent renders."""
+        input_file_paths = [test_data_file('inputs/input_file.yml')]
+        expected_resources = konfigenetes(input_file_paths=input_file_paths, var_values={'PORT': '80'})
+
+        async def render_many(executor):
+            semaphore = asyncio.Semaphore(2)
+            return await asyncio.gather(*[
+                konfigenetes_async(input_file_paths=input_file_paths, var_values={'PORT': '80'},
+                                   executor=executor, semaphore=semaphore)
+                for _ in range(4)])
+
+        self.assertEqual(asyncio.run(render_many(None)), [expected_resources] * 4)
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(asyncio.run(render_many(executor)), [expected_resources] * 4)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(konfigenetes_async(resource_file_paths=[test_data_file('resources/var_config.yml')]))
+
+    def test_cancel(self):
+        """Test a render can be cancelled."""
+        async def cancel_render():
+            render = asyncio.ensure_future(konfigenetes_async(
+                input_file_paths=[test_data_file('inputs/input_file.yml')]))
+            await asyncio.sleep(0)
+            render.cancel()
+            await render
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_render())
+
+
+class TestProfiling(unittest.TestCase):
+    """Profiling tests"""
+
+    def test_profiler(self):
+        """Test the profiler records each phase, file and patch."""
+        with Profiler() as profiler:
+            konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')])
+        self.assertEqual(hooks, [])
+
+        self.assertEqual(set(profiler.phases.keys()), {
+            'resolve_inputs', 'read_input_file', 'load', 'load_file', 'patch', 'apply_patch',
+            'find_vars', 'substitute'})
+        self.assertEqual(profiler.phases['load_file']['calls'], 5)
+        self.assertEqual(profiler.phases['substitute']['calls'], 3)
+
+        patch_events = [(event['patch'], event['matched']) for event in profiler.events if 'patch' in event]
+        self.assertEqual(patch_events, [
+            ('Deployment/basic-service', 1),
+            ('Deployment/basic-service', 1),
+            ('Service/basic-service', 1),
+        ])
+        self.assertIn('patch Service/basic-service matched 1 resources', profiler.format_text())
+
+
+class TestParseCache(unittest.TestCase):
+    """Parse cache tests"""
+
+    def test_cached_render(self):
+        """Test renders through the cache match uncached renders and don't share state."""
+        uncached_resources = konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for _ in range(3):
+                cached_resources = konfigenetes(
+                    input_file_paths=[test_data_file('inputs/input_file.yml')],
+                    cache_dir=cache_dir)
+                self.assertEqual(cached_resources, uncached_resources)
+                # Mutating a render must not leak into the next one.
+                cached_resources[0]['metadata']['name'] = 'mutated'
+
+            self.assertTrue(os.listdir(cache_dir))
+
+    def test_eviction(self):
+        """Test the least recently used entries are evicted past the size limit."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ParseCache(cache_dir, max_size=0)
+            cache.load(test_data_file('resources/pod_and_service.yml'), 'documents', parse_yaml_documents)
+
+            self.assertEqual(cache.entries(), [])
+
+    def test_entries_not_pickled(self):
+        """Test entries aren't unpickled, and files marshal can't hold are parsed every time."""
+        file_path = test_data_file('resources/pod_and_service.yml')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ParseCache(cache_dir)
+            documents = cache.load(file_path, 'documents', parse_yaml_documents)
+            (entry_path, _, _), = cache.entries()
+            with open(entry_path, 'wb') as entry_file:
+                entry_file.write(pickle.dumps([{'kind': 'Tampered'}]))
+
+            self.assertEqual(cache.load(file_path, 'documents', parse_yaml_documents), documents)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with tempfile.NamedTemporaryFile('w', suffix='.yml') as dated_file:
+                dated_file.write('kind: ConfigMap\nmetadata:\n  name: dated\ndata:\n  DATE: 2020-01-01\n')
+                dated_file.flush()
+                cache = ParseCache(cache_dir)
+                documents = cache.load(dated_file.name, 'documents', parse_yaml_documents)
+
+            self.assertEqual(documents[0]['data']['DATE'], datetime.date(2020, 1, 1))
+            self.assertEqual(cache.entries(), [])
+
+    def test_memory_eviction(self):
+        """Test the in-memory cache evicts the least recently used entries past the size limit."""
+        cache = MemoryCache(max_size=1)
+        cache.load(test_data_file('resources/pod_and_service.yml'), 'documents', parse_yaml_documents)
+        cache.load(test_data_file('resources/var_config.yml'), 'documents', parse_yaml_documents)
+
+        self.assertEqual(list(cache.entries), [])
+        self.assertEqual(cache.size, 0)
+
+        cache = MemoryCache()
+        cache.load(test_data_file('resources/pod_and_service.yml'), 'documents', parse_yaml_documents)
+        cache.load(test_data_file('resources/var_config.yml'), 'documents', parse_yaml_documents)
+        self.assertEqual(len(cache.entries), 2)
+        self.assertEqual(cache.size, sum(len(entry_bytes) for _, entry_bytes in cache.entries.values()))
+
+
+class TestRenderCache(unittest.TestCase):
+    """Render cache tests"""
+
+    def test_render_cache(self):
+        """Test output is reused until a file in the input graph changes, and again once it changes back."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(test_data_file(''), str(Path(temp_dir) / 'test_data'))
+            input_file_paths = [str(Path(temp_dir) / 'test_data' / 'inputs' / 'input_file.yml')]
+            child_input_file_path = str(Path(temp_dir) / 'test_data' / 'inputs' / 'child_input_file.yml')
+            render_cache = RenderCache(str(Path(temp_dir) / 'cache'))
+
+            output, hit = render_cache.render(input_file_paths)
+            self.assertFalse(hit)
+            self.assertEqual(output, dump_yaml_documents(konfigenetes(input_file_paths=input_file_paths)) + '\n')
+            self.assertEqual(render_cache.render(input_file_paths), (output, True))
+            self.assertEqual(render_cache.render(input_file_paths, var_values={'PORT': '80'})[1], False)
+
+            with open(child_input_file_path) as child_input_file:
+                child_input = child_input_file.read()
+            with open(child_input_file_path, 'w') as child_input_file:
+                child_input_file.write(child_input.replace('VAR_VALUE=1', 'VAR_VALUE=3'))
+            changed_output, hit = render_cache.render(input_file_paths)
+            self.assertFalse(hit)
+            self.assertNotEqual(changed_output, output)
+
+            with open(child_input_file_path, 'w') as child_input_file:
+                child_input_file.write(child_input)
+            self.assertEqual(render_cache.render(input_file_paths), (output, True))
+
+
+@unittest.skipUnless(yaml.__with_libyaml__, 'libyaml is not installed')
+class TestYamlBackends(unittest.TestCase):
+    """YAML backend tests"""
+
+    def test_backends_match(self):
+        """Test the libyaml and pure Python backends load and dump the test data the same way."""
+        for yaml_path in sorted((Path(__file__).parent / 'test_data').glob('**/*.yml')):
+            with open(str(yaml_path)) as yaml_file:
+                yaml_string = yaml_file.read()
+
+            python_documents = parse_yaml_documents(yaml_string, loader=yaml.SafeLoader)
+            libyaml_documents = parse_yaml_documents(yaml_string, loader=yaml.CSafeLoader)
+            self.assertEqual(python_documents, libyaml_documents, str(yaml_path))
+
+            self.assertEqual(dump_yaml_documents(python_documents, dumper=yaml.SafeDumper),
+                             dump_yaml_documents(python_documents, dumper=yaml.CSafeDumper),
+                             str(yaml_path))
+
+        konfigured_resources = konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')])
+        self.assertEqual(dump_yaml_documents(konfigured_resources, dumper=yaml.SafeDumper),
+                         dump_yaml_documents(konfigured_resources, dumper=yaml.CSafeDumper))
+
+
+class TestBatch(unittest.TestCase):
+    """Batch render tests"""
+
+    def test_read_manifest(self):
+        """Test reading jobs from a batch manifest."""
+        jobs = read_manifest(test_data_file('batch/manifest.yml'))
+
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(jobs[1]['input_file_paths'], [str(Path(test_data_file('batch')) / '../inputs/input_file.yml')])
+        self.assertEqual(jobs[1]['var_values'], {'PORT': '80', 'VAR_VALUE': '2'})
+        self.assertEqual(jobs[1]['output_path'], test_data_file('batch/override.yml'))
+
+    def test_render_many(self):
+        """Test rendering many jobs at once, with failures isolated to their own job."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            jobs = read_manifest(test_data_file('batch/manifest.yml'))
+            for job in jobs:
+                job['output_path'] = str(Path(output_dir) / Path(job['output_path']).name)
+
+            for processes in [1, 2]:
+                results = render_many(jobs, processes=processes)
+
+                self.assertIsNone(results[0]['error'])
+                self.assertIsNone(results[1]['error'])
+                self.assertIn('Missing var: {{ VAR_VALUE }}', results[2]['error'])
+
+                with open(jobs[1]['output_path']) as output_file:
+                    konfigured_resources = list(yaml.safe_load_all(output_file))
+                self.assertEqual(konfigured_resources, konfigenetes(
+                    input_file_paths=[test_data_file('inputs/input_file.yml')],
+                    var_values={'PORT': '80', 'VAR_VALUE': '2'}))
+
+
+class TestTemplate(unittest.TestCase):
+    """Compiled template tests"""
+
+    def test_render_many_var_sets(self):
+        """Test rendering a template with different vars matches rendering from scratch."""
+        template = compile_template(
+            resource_file_paths=[test_data_file('resources/pod_and_service.yml'),
+                                 test_data_file('resources/var_config.yml')],
+            patch_file_paths=[test_data_file('patches/var_port.yml')])
+        compiled_resources = copy.deepcopy(template.resources)
+
+        self.assertEqual(template.required_vars, {'PORT', 'VAR_VALUE'})
+        self.assertEqual(template.missing_vars({'PORT': '80'}), {'VAR_VALUE'})
+        with self.assertRaises(ValueError):
+            template.render({'PORT': '80'})
+
+        for var_values in [{'PORT': '80', 'VAR_VALUE': '1'}, {'PORT': '8000', 'VAR_VALUE': '2'}]:
+            self.assertEqual(template.render(var_values), konfigenetes(
+                resource_file_paths=[test_data_file('resources/pod_and_service.yml'),
+                                     test_data_file('resources/var_config.yml')],
+                patch_file_paths=[test_data_file('patches/var_port.yml')],
+                var_values=var_values))
+        self.assertEqual(template.resources, compiled_resources)
+
+    def test_input_file_vars(self):
+        """Test vars set in input files are defaults that render vars override."""
+        template = compile_template(input_file_paths=[test_data_file('inputs/input_file.yml')])
+
+        self.assertEqual(template.render(), konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')]))
+        self.assertEqual(template.render({'PORT': '80', 'VAR_VALUE': '2'}), konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')],
+            var_values={'PORT': '80', 'VAR_VALUE': '2'}))
+
+
+class TestOutputDir(unittest.TestCase):
+    """Output directory tests"""
+
+    def test_write_output_dir(self):
+        """Test resources are split into files by layout, and unchanged files are not rewritten."""
+        konfigured_resources = konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')],
+            resource_file_paths=[test_data_file('resources/namespaced.yml')])
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            written_paths, unchanged_paths, _ = write_output_dir(konfigured_resources, output_dir, processes=2)
+            self.assertEqual(len(written_paths), 6)
+            self.assertEqual(unchanged_paths, [])
+            with open(str(Path(output_dir) / 'production' / 'configmap' / 'app-config.yml')) as shard_file:
+                self.assertEqual(list(yaml.safe_load_all(shard_file)), [konfigured_resources[4]])
+
+            written_paths, unchanged_paths, _ = write_output_dir(konfigured_resources, output_dir, processes=1)
+            self.assertEqual(written_paths, [])
+            self.assertEqual(len(unchanged_paths), 6)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            written_paths, _, _ = write_output_dir(konfigured_resources, output_dir, layout='kind', processes=1)
+            self.assertEqual(sorted(os.path.relpath(path, output_dir) for path in written_paths), [
+                os.path.join('_cluster', 'configmap.yml'),
+                os.path.join('_cluster', 'deployment.yml'),
+                os.path.join('_cluster', 'service.yml'),
+                os.path.join('production', 'configmap.yml'),
+                os.path.join('staging', 'configmap.yml'),
+            ])
+
+    def test_stale_files(self):
+        """Test only files an earlier run wrote are pruned, and only with prune."""
+        konfigured_resources = konfigenetes(
+            input_file_paths=[test_data_file('inputs/input_file.yml')],
+            resource_file_paths=[test_data_file('resources/namespaced.yml')])
+        staging_resources = [resource for resource in konfigured_resources
+                             if resource['metadata'].get('namespace', None) == 'staging']
+        other_resources = [resource for resource in konfigured_resources if resource not in staging_resources]
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            unrelated_paths = [str(Path(output_dir) / 'sub' / 'dir' / 'x.yml'),
+                               str(Path(output_dir) / 'staging' / 'configmap' / 'values.yml')]
+            for unrelated_path in unrelated_paths:
+                os.makedirs(os.path.dirname(unrelated_path))
+                with open(unrelated_path, 'w') as unrelated_file:
+                    unrelated_file.write('kept: true\n')
+
+            write_output_dir(konfigured_resources, output_dir, processes=1)
+            _, _, removed_paths = write_output_dir(other_resources, output_dir, processes=1)
+            self.assertEqual(removed_paths, [])
+            self.assertTrue(os.path.exists(str(Path(output_dir) / 'staging' / 'configmap' / 'app-config.yml')))
+
+            write_output_dir(konfigured_resources, output_dir, processes=1)
+            _, _, removed_paths = write_output_dir(other_resources, output_dir, processes=1, prune=True)
+            self.assertEqual([os.path.relpath(path, output_dir) for path in removed_paths],
+                             [os.path.join('staging', 'configmap', 'app-config.yml')])
+            for unrelated_path in unrelated_paths:
+                self.assertTrue(os.path.exists(unrelated_path))
+
+            _, _, removed_paths = write_output_dir(other_resources, output_dir, layout='kind', processes=1, prune=True)
+            self.assertEqual(len(removed_paths), 5)
+            self.assertEqual(sorted(os.listdir(output_dir)),
+                             ['.konfigenetes-shards', '_cluster', 'production', 'staging', 'sub'])
+            self.assertEqual(os.listdir(str(Path(output_dir) / 'staging')), ['configmap'])
+
+    def test_file_mode(self):
+        """Test files get the mode the umask gives new files."""
+        previous_umask = os.umask(0o027)
+        try:
+            with tempfile.TemporaryDirectory() as output_dir:
+                written_paths, _, _ = write_output_dir(
+                    konfigenetes(input_file_paths=[test_data_file('inputs/input_file.yml')]), output_dir, processes=1)
+
+                for written_path in written_paths:
+                    self.assertEqual(os.stat(written_path).st_mode & 0o777, 0o640)
+        finally:
+            os.umask(previous_umask)
+
+    def test_since(self):
+        """Test --since is rejected with --output-dir, since files must hold unchanged resources too."""
+        with tempfile.TemporaryDirectory() as output_dir:
+            previous_output_path = str(Path(output_dir) / 'previous.yml')
+            with open(previous_output_path, 'w'):
+                pass
+            completed_process = subprocess.run(
+                [sys.executable, '-m', 'konfigenetes', '-f', test_data_file('inputs/input_file.yml'),
+                 '--since', previous_output_path, '--output-dir', str(Path(output_dir) / 'rendered')],
+                cwd=str(Path(__file__).parent.parent), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True)
+
+            self.assertEqual(completed_process.returncode, 1)
+            self.assertIn('--since can\'t be used with --output-dir', completed_process.stdout)
+            self.assertFalse(os.path.exists(str(Path(output_dir) / 'rendered')))
+
+
+class TestBundle(unittest.TestCase):
+    """Compiled bundle tests"""
+
+    def test_bundle(self):
+        """Test a bundle renders like the files it was compiled from, and damaged bundles are rejected."""
+        input_file_paths = [test_data_file('inputs/input_file.yml')]
+        with tempfile.TemporaryDirectory() as bundle_dir:
+            bundle_path = str(Path(bundle_dir) / 'bundle.kfb')
+            write_bundle(compile_template(input_file_paths=input_file_paths), bundle_path)
+
+            for var_values in [{}, {'VAR_VALUE': '2', 'PORT': '80'}]:
+                self.assertEqual(read_bundle(bundle_path).render(var_values, in_place=True),
+                                 konfigenetes(input_file_paths=input_file_paths, var_values=var_values))
+
+            with open(bundle_path, 'rb') as bundle_file:
+                bundle_bytes = bundle_file.read()
+            with open(bundle_path, 'wb') as bundle_file:
+                bundle_file.write(bundle_bytes[:-1])
+            with self.assertRaisesRegex(ValueError, 'checksum'):
+                read_bundle(bundle_path)
+
+            with open(bundle_path, 'wb') as bundle_file:
+                bundle_file.write(bundle_bytes[:4] + b'\xff\xff' + bundle_bytes[6:])
+            with self.assertRaisesRegex(ValueError, 'format version'):
+                read_bundle(bundle_path)
+
+    def test_bundle_not_pickle(self):
+        """Test bundles are read without unpickling them, so a bundle can't run code."""
+        payload = pickle.dumps({'resources': [], 'var_values': {}, 'var_sites': []})
+        with tempfile.TemporaryDirectory() as bundle_dir:
+            bundle_path = str(Path(bundle_dir) / 'bundle.kfb')
+            with open(bundle_path, 'wb') as bundle_file:
+                bundle_file.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT_VERSION,
+                                                     hashlib.sha256(payload).digest()))
+                bundle_file.write(payload)
+
+            with self.assertRaisesRegex(ValueError, 'corrupt'):
+                read_bundle(bundle_path)
+
+    def test_bundle_mode(self):
+        """Test bundles get the mode the umask gives new files, like any other output."""
+        previous_umask = os.umask(0o027)
+        try:
+            with tempfile.TemporaryDirectory() as bundle_dir:
+                bundle_path = str(Path(bundle_dir) / 'bundle.kfb')
+                write_bundle(compile_template(input_file_paths=[test_data_file('inputs/input_file.yml')]), bundle_path)
+
+                self.assertEqual(os.stat(bundle_path).st_mode & 0o777, 0o640)
+        finally:
+            os.umask(previous_umask)
+
+
+class TestWatch(unittest.TestCase):
+    """Watch mode tests"""
+
+    def setUp(self):
+        self.test_data_dir = tempfile.mkdtemp()
+        shutil.copytree(test_data_file(''), str(Path(self.test_data_dir) / 'test_data'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_data_dir)
+
+    def temp_data_file(self, filename):
+        return str(Path(self.test_data_dir) / 'test_data' / filename)
+
+    def update_file(self, filename, old, new):
+        with open(self.temp_data_file(filename)) as test_file:
+            contents = test_file.read()
+        with open(self.temp_data_file(filename), 'w') as test_file:
+            test_file.write(contents.replace(old, new))
+        # Make sure the change is seen even on filesystems with coarse mtimes.
+        file_stat = os.stat(self.temp_data_file(filename))
+        os.utime(self.temp_data_file(filename), ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 10 ** 9))
+
+    def test_incremental_render(self):
+        """Test only resources affected by a change are re-rendered."""
+        input_file_paths = [self.temp_data_file('inputs/input_file.yml')]
+        watcher = Watcher(input_file_paths=input_file_paths)
+
+        self.assertEqual(watcher.render(), konfigenetes(input_file_paths=input_file_paths))
+        self.assertEqual(watcher.last_rendered_count, 3)
+        self.assertFalse(watcher.changed())
+
+        watcher.render()
+        self.assertEqual(watcher.last_rendered_count, 0)
+        self.assertEqual(watcher.last_read_count, 0)
+
+        self.update_file('patches/env_vars.yml', 'NEW_VAL_1', 'NEWER_VAL_1')
+        self.assertTrue(watcher.changed())
+        self.assertEqual(watcher.render(), konfigenetes(input_file_paths=input_file_paths))
+        self.assertEqual(watcher.last_rendered_count, 1)
+        self.assertEqual(watcher.last_read_count, 1)
+
+        self.update_file('inputs/child_input_file.yml', 'VAR_VALUE=1', 'VAR_VALUE=3')
+        self.assertEqual(watcher.render(), konfigenetes(input_file_paths=input_file_paths))
+        self.assertEqual(watcher.last_rendered_count, 1)
+        self.assertEqual(watcher.last_read_count, 0)
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not supported')
+class TestDaemon(unittest.TestCase):
+    """Render daemon tests"""
+
+    def test_forward(self):
+        """Test forwarding renders to the daemon, and falling back when it isn't running."""
+        with tempfile.TemporaryDirectory() as socket_dir:
+            socket_path = str(Path(socket_dir) / 'konfigenetes.sock')
+            self.assertIsNone(forward(socket_path, ['-f', test_data_file('inputs/input_file.yml')]))
+
+            server = RenderServer(socket_path)
+            server_thread = threading.Thread(target=server.serve_forever)
+            server_thread.start()
+            try:
+                server_response = server.render(['-f', test_data_file('inputs/input_file.yml')], os.getcwd())
+                self.assertEqual(server_response['exit_code'], 0)
+                self.assertEqual(list(yaml.safe_load_all(server_response['stdout'])), konfigenetes(
+                    input_file_paths=[test_data_file('inputs/input_file.yml')]))
+                self.assertTrue(server.cache.entries)
+
+                server_response = server.render(['-r', test_data_file('resources/var_config.yml')], os.getcwd())
+                self.assertEqual(server_response['exit_code'], 1)
+                self.assertIn('Missing var', server_response['stdout'])
+
+                client_stdout = io.StringIO()
+                with contextlib.redirect_stdout(client_stdout):
+                    exit_code = forward(socket_path, ['-r', test_data_file('resources/var_config.yml')])
+                self.assertEqual(exit_code, 1)
+                self.assertEqual(client_stdout.getvalue(), server_response['stdout'])
+            finally:
+                server.shutdown()
+                server.server_close()
+                server_thread.join()
+
+            self.assertFalse(os.path.exists(socket_path))
+
+    def test_forward_bad_response(self):
+        """Test forwarding falls back to rendering in-process when the daemon doesn't send back a whole response."""
+        for response_bytes in [b'', b'{"stdout": "apiVersion: v1', b'{}']:
+            with tempfile.TemporaryDirectory() as socket_dir:
+                socket_path = str(Path(socket_dir) / 'konfigenetes.sock')
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+                    listener.bind(socket_path)
+                    listener.listen(1)
+
+                    def respond():
+                        connection, _ = listener.accept()
+                        with connection:
+                            connection.makefile('rb').read()
+                            connection.sendall(response_bytes)
+
+                    responder_thread = threading.Thread(target=respond)
+                    responder_thread.start()
+                    try:
+                        self.assertIsNone(forward(socket_path, ['-f', test_data_file('inputs/input_file.yml')]))
+                    finally:
+                        responder_thread.join()
+
+    def test_find_socket_path(self):
+        """Test the socket is found in argv without parsing it, before falling back to the environment."""
+        self.assertEqual(find_socket_path(['-f', 'input.yml', '--socket', 'a.sock']), 'a.sock')
+        self.assertEqual(find_socket_path(['--socket=b.sock', '-f', 'input.yml']), 'b.sock')
+
+        previous_socket_path = os.environ.pop('KONFIGENETES_SOCKET', None)
+        try:
+            self.assertIsNone(find_socket_path(['-f', 'input.yml']))
+            os.environ['KONFIGENETES_SOCKET'] = 'c.sock'
+            self.assertEqual(find_socket_path(['-f', 'input.yml']), 'c.sock')
+        finally:
+            os.environ.pop('KONFIGENETES_SOCKET', None)
+            if previous_socket_path is not None:
+                os.environ['KONFIGENETES_SOCKET'] = previous_socket_path
+
+
+class TestStartup(unittest.TestCase):
+    """Startup time tests"""
+
+    # Cumulative time to import the command line entry point, which measures about 6ms.
+    STARTUP_BUDGET_SECONDS = 0.02
+
+    def import_times(self, module_name):
+        """Import a module in a fresh interpreter, returning the cumulative import time of each module in seconds."""
+        completed_process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module_name)],
+            cwd=str(Path(__file__).parent.parent), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, check=True)
+
+        import_times = {}
+        for line in completed_process.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                import_times[fields[2].strip()] = int(fields[1]) / 1000000
+        return import_times
+
+    def test_library_imports(self):
+        """Test importing the library doesn't import modules only the command line or error paths need."""
+        import_times = self.import_times('konfigenetes.konfigenetes')
+
+        for module_name in ['argparse', 'pprint', 'concurrent.futures', 'tracemalloc', 'pickle']:
+            self.assertNotIn(module_name, import_times)
+
+    def test_cli_imports(self):
+        """Test importing the command line entry point doesn't import the library or PyYAML."""
+        import_times = self.import_times('konfigenetes.cli')
+
+        for module_name in ['argparse', 'yaml', 'konfigenetes.konfigenetes']:
+            self.assertNotIn(module_name, import_times)
+
+    def test_startup_budget(self):
+        """Test the command line entry point imports within the startup budget."""
+        startup_time = min(self.import_times('konfigenetes.cli')['konfigenetes.cli'] for _ in range(3))
+
+        self.assertLess(startup_time, self.STARTUP_BUDGET_SECONDS)
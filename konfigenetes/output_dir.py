@@ -0,0 +1,125 @@
+import hashlib
+import multiprocessing
+import os
+import re
+
+from konfigenetes.konfigenetes import dump_output, write_file_atomically
+
+FILE_EXTENSIONS = {'yaml': '.yml', 'json': '.json', 'ndjson': '.ndjson'}
+# Directory for resources without a namespace, such as Namespaces and CustomResourceDefinitions.
+CLUSTER_DIR = '_cluster'
+UNSAFE_PATH_PATTERN = re.compile(r'[^A-Za-z0-9._-]')
+# Lists the files written to an output directory, so the next run knows which files it may prune.
+MANIFEST_FILE_NAME = '.konfigenetes-shards'
+
+
+def write_output_dir(resources, output_dir, layout='resource', output_format='yaml', processes=None, prune=False):
+    """
+    Write resources to files in output_dir, split up by layout:
+    "resource" writes each resource to <namespace>/<kind>/<name>, and "kind" writes
+    the resources of each kind to <namespace>/<kind>. Resources keep their order within a file.
+    Files are serialized in a process pool and written atomically, and files whose content
+    hasn't changed are left alone.
+    The files written are listed in a manifest in output_dir. With prune, files the previous run listed
+    that weren't written this time are removed, so files konfigenetes didn't write are never touched.
+    Returns the paths written, the paths left unchanged and the paths removed.
+    """
+    shards = {}
+    for resource in resources:
+        shard_path = os.path.join(output_dir, shard_file_path(resource, layout) + FILE_EXTENSIONS[output_format])
+        shards.setdefault(shard_path, []).append(resource)
+    shard_jobs = [(shard_path, shard_resources, output_format) for shard_path, shard_resources in shards.items()]
+
+    if processes == 1 or len(shard_jobs) <= 1:
+        results = [write_shard(shard_job) for shard_job in shard_jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(write_shard, shard_jobs)
+
+    written_paths = [shard_path for shard_path, written in results if written]
+    unchanged_paths = [shard_path for shard_path, written in results if not written]
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    shard_names = [os.path.relpath(shard_path, output_dir) for shard_path in shards]
+    removed_paths = []
+    if prune:
+        removed_paths = remove_stale_shards(output_dir, read_manifest(manifest_path), shard_names)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = ''.join(shard_name + '\n' for shard_name in sorted(shard_names))
+    write_file_atomically(manifest_path, manifest.encode('utf-8'))
+
+    return written_paths, unchanged_paths, removed_paths
+
+
+def read_manifest(manifest_path):
+    """Read the files a previous run wrote, relative to the output directory. Entries outside it are ignored."""
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            shard_names = manifest_file.read().splitlines()
+    except FileNotFoundError:
+        return []
+    return [os.path.normpath(shard_name) for shard_name in shard_names
+            if shard_name and not os.path.isabs(shard_name) and
+            os.path.normpath(shard_name).split(os.sep)[0] != os.pardir]
+
+
+def remove_stale_shards(output_dir, previous_shard_names, shard_names):
+    """
+    Remove the files in previous_shard_names that aren't in shard_names, along with the directories
+    that leaves empty, short of output_dir itself. Returns the paths removed.
+    """
+    shard_names = set(os.path.normpath(shard_name) for shard_name in shard_names)
+    removed_paths = []
+    for shard_name in previous_shard_names:
+        if shard_name in shard_names:
+            continue
+        shard_path = os.path.join(output_dir, shard_name)
+        try:
+            os.remove(shard_path)
+        except FileNotFoundError:
+            continue
+        removed_paths.append(shard_path)
+
+        shard_dir = os.path.dirname(shard_name)
+        while shard_dir:
+            try:
+                os.rmdir(os.path.join(output_dir, shard_dir))
+            except OSError:
+                # Not empty.
+                break
+            shard_dir = os.path.dirname(shard_dir)
+
+    return removed_paths
+
+
+def shard_file_path(resource, layout):
+    """The path of the file a resource is written to, relative to the output directory and without extension."""
+    metadata = resource.get('metadata', None) or {}
+    namespace = safe_path_part(metadata.get('namespace', None), CLUSTER_DIR)
+    kind = safe_path_part(resource.get('kind', None), '_unknown').lower()
+    if layout == 'kind':
+        return os.path.join(namespace, kind)
+    return os.path.join(namespace, kind, safe_path_part(metadata.get('name', None), '_unnamed'))
+
+
+def safe_path_part(value, default):
+    if value is None or str(value) in ['', '.', '..']:
+        return default
+    return UNSAFE_PATH_PATTERN.sub('_', str(value))
+
+
+def write_shard(shard_job):
+    """Write one file atomically, unless it already has this content. Returns the path and whether it was written."""
+    shard_path, shard_resources, output_format = shard_job
+    shard_bytes = dump_output(shard_resources, output_format=output_format).encode('utf-8')
+
+    try:
+        with open(shard_path, 'rb') as existing_file:
+            if hashlib.sha256(existing_file.read()).digest() == hashlib.sha256(shard_bytes).digest():
+                return shard_path, False
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+    write_file_atomically(shard_path, shard_bytes)
+    return shard_path, True
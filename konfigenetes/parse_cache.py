@@ -0,0 +1,184 @@
+import collections
+import hashlib
+import marshal
+import os
+import pickle
+import tempfile
+import threading
+
+import yaml
+
+# Bump when the layout of cache entries changes.
+CACHE_FORMAT_VERSION = 2
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+CACHE_FILE_SUFFIX = '.marshal'
+# Entries of earlier cache formats, which are evicted like any other entry.
+LEGACY_CACHE_FILE_SUFFIXES = ('.pickle',)
+MARSHAL_VERSION = 4
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed YAML files.
+    Entries are keyed on the canonical file path, its mtime and size, and a hash of its content,
+    and are stored with marshal, so a cache directory shared between CI runs can't make a load run code.
+    Files that parse to values marshal can't hold, such as YAML dates, are parsed every time instead.
+    The least recently used entries are evicted once the cache grows past max_size bytes.
+    Every load reads a fresh copy, so callers are free to mutate what they get back.
+    A cache may be shared between threads.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = DEFAULT_MAX_SIZE if max_size is None else max_size
+        self.size = None
+        self.size_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def load(self, file_path, kind, parse):
+        """
+        Load a file through the cache.
+        kind names the parse function, so different parses of the same file don't collide.
+        """
+        with open(file_path, 'rb') as cached_file:
+            content = cached_file.read()
+            file_stat = os.fstat(cached_file.fileno())
+
+        key = hashlib.sha256('\0'.join([
+            str(CACHE_FORMAT_VERSION),
+            yaml.__version__,
+            kind,
+            os.path.realpath(file_path),
+            str(file_stat.st_mtime_ns),
+            str(file_stat.st_size),
+            hashlib.sha256(content).hexdigest(),
+        ]).encode('utf-8')).hexdigest()
+        entry_path = self.entry_path(key)
+
+        try:
+            return self.read(entry_path)
+        except Exception:
+            # Missing or unreadable entries are a cache miss.
+            pass
+
+        data = parse(content)
+        self.store(entry_path, data)
+        return data
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def read(self, entry_path):
+        with open(entry_path, 'rb') as entry_file:
+            data = marshal.load(entry_file)
+        # Mark the entry as recently used.
+        os.utime(entry_path)
+        return data
+
+    def store(self, entry_path, data):
+        try:
+            entry_bytes = marshal.dumps(data, MARSHAL_VERSION)
+        except ValueError:
+            return
+        entry_fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(entry_fd, 'wb') as entry_file:
+                entry_file.write(entry_bytes)
+            os.replace(temp_path, entry_path)
+        except OSError:
+            # A cache that can't be written to shouldn't break the render.
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        with self.size_lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += len(entry_bytes)
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        """List (path, size, last used time) for every entry in the cache."""
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith((CACHE_FILE_SUFFIX,) + LEGACY_CACHE_FILE_SUFFIXES):
+                continue
+            entry_path = os.path.join(self.cache_dir, file_name)
+            try:
+                entry_stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((entry_path, entry_stat.st_size, entry_stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_size."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+class MemoryCache:
+    """
+    In-memory cache of parsed files, keyed on the canonical file path.
+    Entries are invalidated when a file's mtime or size changes, and the least recently used entries are
+    evicted past max_size pickled bytes, if max_size is set.
+    Parsed data is kept pickled, so every load returns a fresh copy and the cache can be
+    sent to worker processes cheaply.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be pickled, so worker processes get a fresh one.
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def load(self, file_path, kind, parse):
+        file_stat = os.stat(file_path)
+        key = (kind, os.path.realpath(file_path))
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                return pickle.loads(entry[1])
+
+        with open(file_path, 'rb') as cached_file:
+            data = parse(cached_file.read())
+        entry_bytes = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self.lock:
+            previous_entry = self.entries.pop(key, None)
+            if previous_entry is not None:
+                self.size -= len(previous_entry[1])
+            self.entries[key] = (version, entry_bytes)
+            self.size += len(entry_bytes)
+            if self.max_size is not None:
+                self.evict()
+        return data
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_size."""
+        while self.size > self.max_size and self.entries:
+            _, (_, entry_bytes) = self.entries.popitem(last=False)
+            self.size -= len(entry_bytes)
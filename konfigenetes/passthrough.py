@@ -0,0 +1,167 @@
+import re
+
+import yaml
+
+from konfigenetes.konfigenetes import (dump_yaml_documents, is_json_file, load_resource_documents, load_resource_files,
+                                       map_in_threads, parse_resource_documents)
+from konfigenetes.profiling import phase
+
+DOCUMENT_START_PATTERN = re.compile(r'---(?=\s|$)')
+DOCUMENT_END_PATTERN = re.compile(r'\.\.\.(?=\s|$)')
+KIND_PATTERN = re.compile(r'^kind:[ \t]*(.*?)[ \t]*$', re.MULTILINE)
+METADATA_PATTERN = re.compile(r'^metadata:[ \t]*(#.*)?$', re.MULTILINE)
+NAME_PATTERN = re.compile(r'( +)name:[ \t]*(.*?)[ \t]*$')
+PLAIN_VALUE_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9._/-]*')
+QUOTED_VALUE_PATTERN = re.compile(r'\'([^\']*)\'|"([^"\\]*)"')
+
+str_resolver = yaml.resolver.Resolver()
+
+
+class RawDocument:
+    """A resource document that is output exactly as it was written, without being parsed."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def load_passthrough_resource_files(resource_file_paths, patch_file_paths, cache=None, jobs=1):
+    """
+    Load resources and patches like load_resource_files, but leave resource documents that no patch
+    targets and that have no vars in them as RawDocuments.
+    Returns the (document, needs vars) pairs of the resources and of the patches.
+    """
+    patch_lists = load_resource_files(patch_file_paths, cache=cache, jobs=jobs)
+    patches = [patch for patch_list in patch_lists for patch in patch_list]
+    patch_targets = set((patch.get('kind', None), patch.get('metadata', {}).get('name', None))
+                        for patch, _ in patches)
+
+    resource_lists = map_in_threads(
+        lambda file_path: load_passthrough_documents(file_path, patch_targets, cache=cache), resource_file_paths, jobs)
+    return [resource for resource_list in resource_lists for resource in resource_list], patches
+
+
+def load_passthrough_documents(file_path, patch_targets, cache=None):
+    if is_json_file(file_path):
+        return load_resource_documents(file_path, cache=cache)
+
+    with phase('load_file', file=file_path):
+        if cache is not None:
+            chunks = cache.load(file_path, 'passthrough_chunks', split_documents)
+        else:
+            with open(file_path, 'r') as yaml_file:
+                chunks = split_documents(yaml_file)
+
+        documents = []
+        for text, target in chunks:
+            if target is not None and target not in patch_targets:
+                documents.append((RawDocument(text), False))
+            else:
+                documents += parse_resource_documents(text)
+        return documents
+
+
+def split_documents(stream):
+    """
+    Split a YAML file into the text of each document, without parsing it.
+    Returns a (text, (kind, name)) pair per document. Documents that have vars in them,
+    or whose kind and name can't be read without parsing them, get None instead of (kind, name).
+    """
+    content = stream.read() if hasattr(stream, 'read') else stream
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+
+    lines = content.splitlines(True)
+    # Directives apply across documents, so leave files with any to the parser.
+    if any(line.startswith('%') for line in lines):
+        return [(content, None)]
+
+    chunks = []
+    chunk_lines = []
+    passthrough = True
+    for line in lines:
+        start_match = DOCUMENT_START_PATTERN.match(line)
+        if start_match is not None or DOCUMENT_END_PATTERN.match(line) is not None:
+            chunks.append((chunk_lines, passthrough))
+            chunk_lines = []
+            passthrough = True
+            rest = line[3:].strip()
+            if start_match is not None and rest and not rest.startswith('#'):
+                # The document starts on the marker line, so keep the line for the parser.
+                chunk_lines.append(line)
+                passthrough = False
+            continue
+        chunk_lines.append(line)
+    chunks.append((chunk_lines, passthrough))
+
+    documents = []
+    for chunk_lines, passthrough in chunks:
+        if not any(line.strip() and not line.lstrip().startswith('#') for line in chunk_lines):
+            continue
+        text = ''.join(chunk_lines)
+        if not text.endswith('\n'):
+            text += '\n'
+        target = None
+        if passthrough and '{{' not in text:
+            target = peek_kind_and_name(text)
+        documents.append((text, target))
+    return documents
+
+
+def peek_kind_and_name(text):
+    """
+    Read the kind and metadata.name of a block style YAML document without parsing it.
+    Returns None unless both are unambiguous plain or quoted strings.
+    """
+    kind_matches = KIND_PATTERN.findall(text)
+    metadata_matches = list(METADATA_PATTERN.finditer(text))
+    if len(kind_matches) != 1 or len(metadata_matches) != 1:
+        return None
+    kind = parse_string_value(kind_matches[0])
+
+    names = []
+    name_indent = None
+    for line in text[metadata_matches[0].end():].splitlines()[1:]:
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        if indent == 0:
+            break
+        if name_indent is None:
+            name_indent = indent
+        if indent != name_indent:
+            continue
+        name_match = NAME_PATTERN.match(line)
+        if name_match is not None:
+            names.append(name_match.group(2))
+    if len(names) != 1:
+        return None
+    name = parse_string_value(names[0])
+
+    if kind is None or name is None:
+        return None
+    return (kind, name)
+
+
+def parse_string_value(value):
+    """Read a scalar that YAML would load as a string, or return None if it might load as anything else."""
+    quoted_match = QUOTED_VALUE_PATTERN.fullmatch(value)
+    if quoted_match is not None:
+        return quoted_match.group(1) if quoted_match.group(1) is not None else quoted_match.group(2)
+
+    if PLAIN_VALUE_PATTERN.fullmatch(value) is None:
+        return None
+    # Plain scalars like 123, true or null don't load as strings.
+    if str_resolver.resolve(yaml.ScalarNode, value, (True, False)) != 'tag:yaml.org,2002:str':
+        return None
+    return value
+
+
+def dump_passthrough_output(documents, stream):
+    """Write documents as dump_output writes YAML, copying RawDocuments to stream as they were written."""
+    for document in documents:
+        if isinstance(document, RawDocument):
+            stream.write('---\n')
+            stream.write(document.text)
+        else:
+            dump_yaml_documents([document], stream=stream)
+    stream.write('\n')
@@ -0,0 +1,115 @@
+import contextlib
+import threading
+import time
+
+# Called with an event dict at the end of every phase. Phases are only timed while there are hooks.
+hooks = []
+
+# Phases can nest, and run in several threads at once when loading files.
+phase_state = threading.local()
+
+
+def add_hook(hook):
+    hooks.append(hook)
+
+
+def remove_hook(hook):
+    hooks.remove(hook)
+
+
+@contextlib.contextmanager
+def phase(name, **details):
+    """
+    Time a phase of a render and report it to the hooks.
+    Yields a dict of details about the phase, which the phase can add to.
+    Memory is only measured for outermost phases on the main thread, while tracemalloc is tracing.
+    """
+    if not hooks:
+        yield details
+        return
+
+    import tracemalloc
+
+    depth = getattr(phase_state, 'depth', 0)
+    trace_memory = (depth == 0 and threading.current_thread() is threading.main_thread() and
+                    tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'))
+    if trace_memory:
+        tracemalloc.reset_peak()
+
+    phase_state.depth = depth + 1
+    start_time = time.perf_counter()
+    try:
+        yield details
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        phase_state.depth = depth
+
+    event = dict(details, phase=name, time=elapsed_time, depth=depth)
+    if trace_memory:
+        event['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    for hook in hooks:
+        hook(event)
+
+
+class Profiler:
+    """
+    Hook that collects wall time, call counts and peak memory for each phase,
+    along with the individual file and patch events.
+    Nested phases are included in the time of the phases they run in.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.events = []
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        with self.lock:
+            phase_totals = self.phases.setdefault(event['phase'], {'time': 0.0, 'calls': 0})
+            phase_totals['time'] += event['time']
+            phase_totals['calls'] += 1
+            if 'peak_memory' in event:
+                phase_totals['peak_memory'] = max(phase_totals.get('peak_memory', 0), event['peak_memory'])
+            if 'file' in event or 'patch' in event:
+                self.events.append(event)
+
+    def __enter__(self):
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_hook(self)
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.stop()
+
+    def report(self):
+        return {
+            'phases': self.phases,
+            'events': self.events,
+        }
+
+    def format_json(self):
+        import json
+        return json.dumps(self.report(), indent=2, sort_keys=True)
+
+    def format_text(self):
+        lines = ['Profile:']
+        for phase_name, phase_totals in self.phases.items():
+            line = '  {:<20} {:>10.1f} ms {:>6} calls'.format(
+                phase_name, phase_totals['time'] * 1000, phase_totals['calls'])
+            if 'peak_memory' in phase_totals:
+                line += ' {:>10.1f} MiB peak'.format(phase_totals['peak_memory'] / (1024 * 1024))
+            lines.append(line)
+
+        for event in self.events:
+            if 'patch' in event:
+                lines.append('  patch {} matched {} resources in {:.2f} ms'.format(
+                    event['patch'], event.get('matched', 0), event['time'] * 1000))
+            else:
+                lines.append('  {} {} in {:.2f} ms'.format(event['phase'], event['file'], event['time'] * 1000))
+        return '\n'.join(lines)
@@ -0,0 +1,95 @@
+import hashlib
+import os
+
+import yaml
+
+from konfigenetes.konfigenetes import dump_output, konfigenetes, resolve_input_files
+from konfigenetes.parse_cache import CACHE_FORMAT_VERSION, MemoryCache, ParseCache
+from konfigenetes.version import VERSION
+
+
+class RenderCache(ParseCache):
+    """
+    On-disk cache of rendered output.
+    Output is keyed on the content of every file in the input graph, the arguments it was rendered with
+    and the konfigenetes version, so a hit skips parsing and patching entirely. Vars set by input files
+    are covered by their content, and vars set on the command line by the arguments.
+    The files each set of arguments resolved to are remembered too, so a lookup only hashes those files.
+    If the graph has changed since, one of them has changed with it.
+    """
+
+    def render(self, input_file_paths=None, resource_file_paths=None, patch_file_paths=None, var_values=None,
+               output_format='yaml', jobs=1, cache=None):
+        """
+        Render like konfigenetes() and dump the result as the command line writes it.
+        Returns the output and whether it came from the cache.
+        """
+        input_file_paths = input_file_paths or []
+        resource_file_paths = resource_file_paths or []
+        patch_file_paths = patch_file_paths or []
+        var_values = var_values or {}
+
+        request_key = self.request_key(input_file_paths, resource_file_paths, patch_file_paths, var_values,
+                                       output_format)
+        output = self.lookup(request_key)
+        if output is not None:
+            return output, True
+
+        # Input files are parsed again by konfigenetes(), so keep them in memory.
+        if cache is None:
+            cache = MemoryCache()
+        input_data = resolve_input_files(input_file_paths, cache=cache)
+        graph_file_paths = (input_data['input_file_paths'] +
+                            input_data['resource_file_paths'] + resource_file_paths +
+                            input_data['patch_file_paths'] + patch_file_paths)
+        content_key = self.content_key(request_key, graph_file_paths)
+
+        output = dump_output(konfigenetes(input_file_paths, resource_file_paths, patch_file_paths,
+                                          var_values, jobs=jobs, cache=cache), output_format=output_format)
+
+        # Don't store output rendered from files that changed under it.
+        if content_key is not None and content_key == self.content_key(request_key, graph_file_paths):
+            self.store(self.entry_path(request_key), graph_file_paths)
+            self.store(self.entry_path(content_key), output)
+        return output, False
+
+    def lookup(self, request_key):
+        """Return the stored output for a request, or None if it isn't stored or its files changed."""
+        try:
+            graph_file_paths = self.read(self.entry_path(request_key))
+        except Exception:
+            return None
+
+        content_key = self.content_key(request_key, graph_file_paths)
+        if content_key is None:
+            return None
+        try:
+            return self.read(self.entry_path(content_key))
+        except Exception:
+            return None
+
+    def request_key(self, input_file_paths, resource_file_paths, patch_file_paths, var_values, output_format):
+        return hashlib.sha256('\0'.join([
+            str(CACHE_FORMAT_VERSION),
+            'render',
+            VERSION,
+            yaml.__version__,
+            repr([os.path.realpath(file_path) for file_path in input_file_paths]),
+            repr([os.path.realpath(file_path) for file_path in resource_file_paths]),
+            repr([os.path.realpath(file_path) for file_path in patch_file_paths]),
+            repr(sorted(var_values.items())),
+            output_format,
+        ]).encode('utf-8')).hexdigest()
+
+    def content_key(self, request_key, file_paths):
+        """Hash the content of every file a request resolved to, or return None if one can't be read."""
+        content_hash = hashlib.sha256(request_key.encode('utf-8'))
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'rb') as graph_file:
+                    content = graph_file.read()
+            except OSError:
+                return None
+            content_hash.update('\0{}\0'.format(os.path.realpath(file_path)).encode('utf-8'))
+            content_hash.update(hashlib.sha256(content).digest())
+        return content_hash.hexdigest()
@@ -0,0 +1,71 @@
+import copy
+
+from konfigenetes.konfigenetes import (check_missing_vars, extract_string_parts, load_patched_resources,
+                                       substitute_vars, walk_var_strings)
+from konfigenetes.parse_cache import ParseCache
+
+
+def compile_template(input_file_paths=None, resource_file_paths=None, patch_file_paths=None,
+                     cache_dir=None, jobs=1, cache=None):
+    """Load and patch resources once, for rendering with many sets of vars."""
+    if cache is None and cache_dir is not None:
+        cache = ParseCache(cache_dir)
+
+    resources, var_values, resources_need_vars = load_patched_resources(
+        input_file_paths, resource_file_paths, patch_file_paths, cache=cache, jobs=jobs)
+    return Template(resources, var_values, resources_need_vars)
+
+
+class Template:
+    """
+    Patched resources along with where vars need to be substituted into them.
+    Rendering never changes the template, so it can be rendered any number of times.
+    """
+
+    def __init__(self, resources, var_values=None, resources_need_vars=None, var_sites=None):
+        self.resources = resources
+        # Defaults, such as the vars set in input files.
+        self.var_values = var_values or {}
+        if var_sites is None:
+            if resources_need_vars is None:
+                resources_need_vars = [True] * len(resources)
+            var_sites = [find_var_sites(resource) if needs_vars else []
+                         for resource, needs_vars in zip(resources, resources_need_vars)]
+        self.var_sites = var_sites
+        self.required_vars = set([var_value for var_sites in self.var_sites
+                                  for _, string_parts in var_sites
+                                  for var_type, var_value in string_parts
+                                  if var_type == 'var'])
+
+    def missing_vars(self, var_values=None):
+        var_values = dict(self.var_values, **(var_values or {}))
+        return set([var_name for var_name in self.required_vars if var_name not in var_values])
+
+    def render(self, var_values=None, in_place=False):
+        """
+        Render a fresh copy of the resources with vars substituted.
+        With in_place, vars are substituted into the template's own resources instead of a copy.
+        That saves copying them when the template is only rendered once.
+        """
+        # Passed in vars override the defaults.
+        var_values = dict(self.var_values, **(var_values or {}))
+        check_missing_vars(self.required_vars, var_values)
+
+        resources = self.resources if in_place else copy.deepcopy(self.resources)
+        for resource, var_sites in zip(resources, self.var_sites):
+            for path, string_parts in var_sites:
+                parent = resource
+                for key in path[:-1]:
+                    parent = parent[key]
+                parent[path[-1]] = substitute_vars(string_parts, var_values)
+        return resources
+
+
+def find_var_sites(resource):
+    """Find the (path, string parts) of every string in a resource that contains vars."""
+    var_sites = []
+    for container, key, path in walk_var_strings(resource, path=()):
+        string_parts = extract_string_parts(container[key])
+        if any(var_type == 'var' for var_type, _ in string_parts):
+            var_sites.append((path, string_parts))
+    return var_sites
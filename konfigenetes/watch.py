@@ -0,0 +1,171 @@
+import copy
+import os
+import sys
+import time
+
+import yaml
+
+from konfigenetes.konfigenetes import (apply_patches, check_missing_vars, dump_output,
+                                       find_string_var_lists_recursive, load_yaml_documents, parse_var_values,
+                                       resolve_input_files)
+from konfigenetes.parse_cache import MemoryCache
+
+DEFAULT_INTERVAL = 0.5
+
+
+def watch(input_file_paths=None, resource_file_paths=None, patch_file_paths=None, var_values=None,
+          output_path=None, output_format='yaml', interval=DEFAULT_INTERVAL):
+    """
+    Render, then poll every file in the input graph and re-render whenever one changes.
+    Errors are reported on stderr and the watch carries on.
+    """
+    watcher = Watcher(input_file_paths, resource_file_paths, patch_file_paths, var_values)
+    while True:
+        try:
+            konfigured_resources = watcher.render()
+        except (ValueError, OSError, yaml.YAMLError) as e:
+            print('Error:\n{}'.format(e), file=sys.stderr)
+        else:
+            write_output(konfigured_resources, output_path, output_format=output_format)
+            print('Rendered {} resources in {:.1f} ms ({} re-rendered, {} files re-read)'.format(
+                len(konfigured_resources), watcher.last_render_time * 1000,
+                watcher.last_rendered_count, watcher.last_read_count), file=sys.stderr)
+
+        while not watcher.changed():
+            time.sleep(interval)
+
+
+def write_output(konfigured_resources, output_path, output_format='yaml'):
+    if output_path is None:
+        dump_output(konfigured_resources, output_format=output_format, stream=sys.stdout)
+        sys.stdout.flush()
+        return
+
+    temp_path = '{}.tmp'.format(output_path)
+    with open(temp_path, 'w') as output_file:
+        dump_output(konfigured_resources, output_format=output_format, stream=output_file)
+    os.replace(temp_path, output_path)
+
+
+def file_version(file_path):
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+class Watcher:
+    """
+    Renders the same arguments as konfigenetes() repeatedly, redoing only the work affected by changed files.
+    Input files are re-read through a MemoryCache, and resource and patch files are only re-parsed when they change.
+    Each rendered resource is remembered along with the patches and var values it was rendered with,
+    and is reused as long as none of those changed.
+    """
+
+    def __init__(self, input_file_paths=None, resource_file_paths=None, patch_file_paths=None, var_values=None):
+        self.input_file_paths = input_file_paths or []
+        self.resource_file_paths = resource_file_paths or []
+        self.patch_file_paths = patch_file_paths or []
+        self.var_values = var_values or {}
+
+        self.input_cache = MemoryCache()
+        # Version of every file in the input graph, as of the last render.
+        self.file_versions = {}
+        # Parsed documents of resource and patch files, by path.
+        self.documents = {}
+        # Rendered resources by (position in the resource files, file path, document index).
+        self.rendered_resources = {}
+
+        self.last_render_time = 0
+        self.last_rendered_count = 0
+        self.last_read_count = 0
+
+    def changed(self):
+        """Check whether any file in the input graph changed since the last render."""
+        return any(file_version(file_path) != version for file_path, version in self.file_versions.items())
+
+    def render(self):
+        try:
+            return self.render_changed()
+        except Exception:
+            # Don't re-render until something changes again.
+            self.file_versions = dict((file_path, file_version(file_path)) for file_path in self.file_versions)
+            raise
+
+    def render_changed(self):
+        start_time = time.perf_counter()
+        self.last_rendered_count = 0
+        self.last_read_count = 0
+
+        input_data = resolve_input_files(self.input_file_paths, cache=self.input_cache)
+        resource_file_paths = input_data['resource_file_paths'] + self.resource_file_paths
+        patch_file_paths = input_data['patch_file_paths'] + self.patch_file_paths
+        var_values = dict(parse_var_values(input_data['var_values_raw']), **self.var_values)
+
+        file_versions = {}
+        for file_path in input_data['input_file_paths']:
+            file_versions[file_path] = file_version(file_path)
+        for file_path in resource_file_paths + patch_file_paths:
+            file_versions[file_path] = file_version(file_path)
+            if file_path not in self.documents or file_versions[file_path] != self.file_versions.get(file_path):
+                self.documents[file_path] = load_yaml_documents(file_path)
+                self.last_read_count += 1
+        # Watch the new graph even if rendering it fails.
+        self.file_versions = file_versions
+
+        patches_by_target = {}
+        for file_path in patch_file_paths:
+            for patch_index, patch in enumerate(self.documents[file_path]):
+                patch_name = patch.get('metadata', {}).get('name', None)
+                patch_kind = patch.get('kind', None)
+                patch_id = (file_path, patch_index, file_versions[file_path])
+                patches_by_target.setdefault((patch_kind, patch_name), []).append((patch_id, patch))
+
+        # Report errors in every patch, including those that match no resource.
+        apply_patches([], [patch for file_path in patch_file_paths for patch in self.documents[file_path]])
+
+        # Patch and find vars in the resources that changed, or whose patches changed.
+        rendered_resources = {}
+        pending_resources = []
+        for file_position, file_path in enumerate(resource_file_paths):
+            for resource_index, resource in enumerate(self.documents[file_path]):
+                resource_id = (file_position, file_path, resource_index)
+                resource_name = resource.get('metadata', {}).get('name', None)
+                resource_kind = resource.get('kind', None)
+                patches = patches_by_target.get((resource_kind, resource_name), [])
+                source = (file_versions[file_path], [patch_id for patch_id, _ in patches])
+
+                previous = self.rendered_resources.get(resource_id)
+                if previous is not None and previous['source'] == source and all(
+                        var_values.get(var_name) == var_value for var_name, var_value in previous['vars'].items()):
+                    rendered_resources[resource_id] = previous
+                    continue
+
+                patched_resource = copy.deepcopy(resource)
+                apply_patches([patched_resource], copy.deepcopy([patch for _, patch in patches]))
+                pending_resources.append((resource_id, source, patched_resource,
+                                          find_string_var_lists_recursive(patched_resource)))
+
+        check_missing_vars(set([needed_var for _, _, _, string_var_lists in pending_resources
+                                for string_var_list in string_var_lists
+                                for needed_var in string_var_list.needed_vars]),
+                           var_values)
+
+        for resource_id, source, patched_resource, string_var_lists in pending_resources:
+            needed_vars = set([needed_var for string_var_list in string_var_lists
+                               for needed_var in string_var_list.needed_vars])
+            for string_var_list in string_var_lists:
+                string_var_list.save(var_values)
+            rendered_resources[resource_id] = {
+                'source': source,
+                'vars': dict((var_name, var_values[var_name]) for var_name in needed_vars),
+                'resource': patched_resource,
+            }
+        self.last_rendered_count = len(pending_resources)
+
+        self.rendered_resources = rendered_resources
+        self.last_render_time = time.perf_counter() - start_time
+        return [rendered_resources[(file_position, file_path, resource_index)]['resource']
+                for file_position, file_path in enumerate(resource_file_paths)
+                for resource_index in range(len(self.documents[file_path]))]
@@ -6,7 +6,9 @@ import sys
 from setuptools import setup
 from setuptools.command.install import install
 
-VERSION = "1.0.0"
+# Read the version without importing the package, which needs PyYAML.
+with open(os.path.join(os.path.dirname(__file__), "konfigenetes", "version.py")) as version_file:
+    exec(version_file.read())
 
 
 class VerifyVersionCommand(install):
@@ -40,18 +42,21 @@ setup(
         "Topic :: Software Development :: Libraries :: Python Modules",
         "Topic :: Internet",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3 :: Only",
     ],
     keywords="kubernetes config configuration template templating build",
     packages=["konfigenetes"],
+    entry_points={
+        "console_scripts": [
+            "konfigenetes = konfigenetes.cli:main",
+        ],
+    },
     install_requires=[
         "PyYAML==4.2b4",
     ],
-    python_requires=">=3",
+    python_requires=">=3.7",
     cmdclass={
         "verify": VerifyVersionCommand,
     },